@@ -0,0 +1,234 @@
+"""
+Benchmarks of the eye data processing path.
+
+Synthetic trial pickles are made the way saveTrialData used to write them
+(a pickled list of LiveTrack EyeData structures per trial, see simLiveTrack
+for the structure) and every benchmark runs in a fresh process, so its peak
+RSS is its own:
+    legacy      getdict/eyeData2DF, one dataframe per sample (the old path)
+    frame       eyeData2Frame, one trial at a time in this process
+                (both time only the conversion, not unpickling)
+    csv         convertSession to CSV (mpFunc pool and shared memory slots)
+    parquet     convertSession to the parquet store (see eyeDataStore)
+    recorder    EyeRecorder.append of every trial (see eyeRecorder)
+    trialSave   the per trial work of saveTrialData: record snapshot,
+                TrialWriter row and EyeRecorder append
+Each run appends one JSON line to the results file with the commit, the
+settings and, per benchmark, the time, samples/sec and peak RSS, so runs on
+different commits can be compared line by line.
+"""
+
+import json
+import os
+import pickle
+import platform
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+from multiprocessing import get_context
+import numpy as np
+import simLiveTrack
+
+
+def makeTrialPickles(dirPath, nTrials, samplesPerTrial, seed=0):
+    # writes nTrials pickles of synthetic samples, named by trial number
+    os.makedirs(dirPath, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    blinkUntil = 0
+    for trial in range(nTrials):
+        samples, blinkUntil = simLiveTrack.makeSamples(trial * samplesPerTrial,
+                                                       samplesPerTrial, rng,
+                                                       blinkUntil)
+        with open(os.path.join(dirPath, str(trial)), 'wb') as pickleObject:
+            pickle.dump(simLiveTrack.toStructs(samples), pickleObject)
+
+
+def loadTrials(dirPath):
+    # this function returns the list of samples of every trial pickle in order
+    trials = []
+    for fileName in sorted(os.listdir(dirPath), key=int):
+        with open(os.path.join(dirPath, fileName), 'rb') as pickleObject:
+            trials.append(pickle.load(pickleObject))
+    return trials
+
+
+# benchmarks, each returns the number of samples (and trials) it processed
+def benchLegacy(dataDir, workDir, settings):
+    import pandas as pd
+    import mpPickleProcess
+    mpPickleProcess.data = loadTrials(dataDir)[0][:settings['legacySamples']]
+    start = time.perf_counter()
+    pd.concat([mpPickleProcess.eyeData2DF(i) for i in range(len(mpPickleProcess.data))])
+    settings['timedFrom'] = start
+    return len(mpPickleProcess.data), 1
+
+
+def benchFrame(dataDir, workDir, settings):
+    import mpPickleProcess
+    trials = loadTrials(dataDir)
+    start = time.perf_counter()
+    nSamples = 0
+    for samples in trials:
+        nSamples += len(mpPickleProcess.eyeData2Frame(samples))
+    settings['timedFrom'] = start
+    return nSamples, len(trials)
+
+
+def benchCsv(dataDir, workDir, settings):
+    import mpPickleProcess
+    csvPath = os.path.join(workDir, 'eyeData.csv')
+    mpPickleProcess.convertSession(dataDir, csvPath, processes=settings['processes'])
+    return settings['nTrials'] * settings['samplesPerTrial'], settings['nTrials']
+
+
+def benchParquet(dataDir, workDir, settings):
+    import mpPickleProcess
+    mpPickleProcess.convertSession(dataDir, os.path.join(workDir, 'parquet'),
+                                   'parquet', 'bench', 0, settings['processes'])
+    return settings['nTrials'] * settings['samplesPerTrial'], settings['nTrials']
+
+
+def benchRecorder(dataDir, workDir, settings):
+    import eyeRecorder
+    trials = loadTrials(dataDir)
+    os.makedirs(os.path.join(workDir, 'recorder'))
+    recorder = eyeRecorder.EyeRecorder(os.path.join(workDir, 'recorder'))
+    start = time.perf_counter()
+    for trial, samples in enumerate(trials):
+        recorder.append(trial, samples)
+    recorder.close()
+    settings['timedFrom'] = start
+    return sum(len(samples) for samples in trials), len(trials)
+
+
+def benchTrialSave(dataDir, workDir, settings):
+    import eyeRecorder
+    import trialRecord
+    import trialWriter
+    trials = loadTrials(dataDir)
+    # a record like the protocol's, numbers, missing values and a history
+    keys = ['trialTotal', 'blockTrial', 'block'] + [f"value{i}" for i in range(40)]
+    keys += ['choiceHist', 'ratingHist']
+    TrialRecord = trialRecord.makeRecordType('TrialRecord', keys)
+    choiceLog = trialRecord.HistoryLog((int, float), list)
+    record = TrialRecord()
+    writer = trialWriter.TrialWriter(os.path.join(workDir, 'trials.csv'),
+                                     ['partID'] + keys, fixedValues={'partID': 'bench'})
+    os.makedirs(os.path.join(workDir, 'recorder'))
+    recorder = eyeRecorder.EyeRecorder(os.path.join(workDir, 'recorder'))
+    start = time.perf_counter()
+    for trial, samples in enumerate(trials):
+        record['trialTotal'] = trial
+        record['blockTrial'] = trial % 16
+        record['block'] = trial // 16
+        for i in range(40):
+            record[f"value{i}"] = None if i % 7 == 0 else trial * 1000.5 + i
+        choiceStart = choiceLog.n
+        choiceLog.extend([[1, 0.8], [0, 1.3]])
+        record['choiceHist'] = choiceLog.span(choiceStart)
+        record['ratingHist'] = choiceLog.span(choiceStart)
+        finishedTrial = record.snapshot()
+        writer.write(finishedTrial)
+        recorder.append(finishedTrial['trialTotal'], samples)
+    recorder.close()
+    writer.close()
+    settings['timedFrom'] = start
+    return sum(len(samples) for samples in trials), len(trials)
+
+
+benchmarks = {'legacy': benchLegacy,
+              'frame': benchFrame,
+              'csv': benchCsv,
+              'parquet': benchParquet,
+              'recorder': benchRecorder,
+              'trialSave': benchTrialSave}
+
+
+def runOne(name, dataDir, settings, resultQueue):
+    # runs one benchmark in this (fresh) process and sends back its result
+    workDir = tempfile.mkdtemp(dir=settings['workRoot'])
+    start = time.perf_counter()
+    try:
+        nSamples, nTrials = benchmarks[name](dataDir, workDir, settings)
+        # benchmarks that load the pickles first time only the part after that
+        seconds = time.perf_counter() - settings.get('timedFrom', start)
+        result = {'name': name,
+                  'samples': nSamples,
+                  'trials': nTrials,
+                  'seconds': seconds,
+                  'samplesPerSec': nSamples / seconds,
+                  'trialsPerSec': nTrials / seconds,
+                  'peakRSSMB': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                  'peakRSSWorkersMB': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024}
+    except Exception as error:
+        result = {'name': name, 'error': repr(error)}
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+    resultQueue.put(result)
+
+
+def gitCommit():
+    # this function returns the commit of this file's repository, or None
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def runBenchmarks(names=None, nTrials=20, samplesPerTrial=5000, legacySamples=2000,
+                  processes=None, resultsPath='benchResults.jsonl'):
+    """Runs the benchmarks and appends the results to resultsPath.
+    Input: names of the benchmarks to run (default: all)
+           number of synthetic trials and samples per trial (5000 == 10s)
+           samples for the legacy benchmark (it is very slow)
+           number of worker processes for csv/parquet (see mpFunc)
+           path of the JSON lines results file
+    Output: dictionary that was appended
+    """
+    settings = {'nTrials': nTrials, 'samplesPerTrial': samplesPerTrial,
+                'legacySamples': legacySamples, 'processes': processes}
+    context = get_context('spawn')
+    workRoot = tempfile.mkdtemp()
+    settings['workRoot'] = workRoot
+    try:
+        dataDir = os.path.join(workRoot, 'pickles')
+        makeTrialPickles(dataDir, nTrials, samplesPerTrial)
+        results = []
+        for name in names or list(benchmarks):
+            resultQueue = context.Queue()
+            process = context.Process(target=runOne,
+                                      args=(name, dataDir, settings, resultQueue))
+            process.start()
+            results.append(resultQueue.get())
+            process.join()
+    finally:
+        shutil.rmtree(workRoot, ignore_errors=True)
+    del settings['workRoot']
+    run = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+           'commit': gitCommit(),
+           'python': platform.python_version(),
+           'numpy': np.__version__,
+           'cpus': os.cpu_count(),
+           'settings': settings,
+           'results': results}
+    with open(resultsPath, 'a') as resultsFile:
+        resultsFile.write(json.dumps(run) + '\n')
+    return run
+
+
+if __name__ == '__main__':
+    nTrials = 20
+    samplesPerTrial = 5000
+    resultsPath = 'benchResults.jsonl'
+    run = runBenchmarks(nTrials=nTrials, samplesPerTrial=samplesPerTrial,
+                        resultsPath=resultsPath)
+    for result in run['results']:
+        if 'error' in result:
+            print(f"{result['name']:10s} failed: {result['error']}")
+        else:
+            print(f"{result['name']:10s} {result['samplesPerSec']:14,.0f} samples/s"
+                  f" {result['peakRSSMB']:8.1f} MB")
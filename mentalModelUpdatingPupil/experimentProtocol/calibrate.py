@@ -8,10 +8,43 @@ import LiveTrack
 import numpy as np
 import math
 import time
-from psychopy import visual, core, monitors, misc
-
-
-if __name__ == '__main__':
+import fixationDetector
+import monitorGeometry
+import gazeModel
+from psychopy import visual, core, monitors
+
+
+def coversGrid(tgtLocs, got):
+    # this function returns whether the targets got include one in every edge
+    # row and column of the grid, so the gaze at the edges is not extrapolated
+    return all(any(tgtLocs[k, axis] == edge for k in got)
+               for axis in (0, 1) for edge in (tgtLocs[:, axis].min(), tgtLocs[:, axis].max()))
+
+
+def validationError(tgtLocs, VectX, VectY):
+    """Held out error of one eye on the targets that have a fixation so far:
+    every target is predicted by the local model (see gazeModel) fitted on
+    the other targets. The error of a model on its own targets is small with
+    few targets whatever the fixations were, so it is not used to stop early.
+    Input: target locations in pixels, fixation medians per target (None
+           where there is none yet)
+    Output: number of targets used, error in pixels (root mean square over
+            the targets, inf until they cover every edge row and column)
+    """
+    got = [k for k in range(len(VectX)) if VectX[k] is not None]
+    if len(got) < 4 or not coversGrid(tgtLocs, got):
+        return len(got), math.inf
+    errors = gazeModel.leaveOneOutError(tgtLocs[got, 0], tgtLocs[got, 1],
+                                        [VectX[k] for k in got], [VectY[k] for k in got])
+    return len(got), math.sqrt(np.mean(np.square(errors)))
+
+
+def main(calibrationPath=None):
+    """Runs the calibration.
+    Input: path to save the calibration points and local gaze models to
+           (see gazeModel), not saved if None
+    Output: dictionary of the calibration (screen, points and models)
+    """
     nPtsX = 5
     nPtsY = 4
 
@@ -24,25 +57,28 @@ if __name__ == '__main__':
         #means that there was a file that read in something
         sX,sY = mon.getSizePix()
         print((sX,sY))
-        minX = misc.pix2deg(-1 * round(sX/2.0) + misc.deg2pix(calibTargRad,mon),mon)
+        screenRes = [sX,sY]
+        screenSize = [10*mon.getWidth(),230];#need to hardcode height
+        print(screenSize)
+        viewDist = 10.0*mon.getDistance()
+        print(viewDist)
+        # exact pixel <-> degree transforms of this monitor (cached on disk)
+        geometry = monitorGeometry.MonitorGeometry(screenSize, screenRes, viewDist)
+        minX = float(geometry.pix2deg(-1 * round(sX/2.0) + geometry.deg2pix(calibTargRad,0),0))
         print(minX)
         maxX = -1 * minX
-        minY = misc.pix2deg(-1 * round(sY/2.0) + misc.deg2pix(calibTargRad,mon),mon)
+        minY = float(geometry.pix2deg(-1 * round(sY/2.0) + geometry.deg2pix(calibTargRad,1),1))
         print(minY)
         maxY = -1 * minY
         targetsDeg = np.array([[x,y] for x in np.linspace(minX,maxX,nPtsX) for y in np.linspace(minY,maxY,nPtsY)])
         print(targetsDeg)
-        screenRes = [sX,sY]
-        screenSize = [10*mon.getWidth(),230];#need to hardcode height
-        print(screenSize)
-        viewDist = 10.0*mon.getDistance()
-        print(viewDist)
         #core.quit()
     else:
         targetsDeg = np.array([[-5,-5],[0,-5],[5,-5],[-5,0],[0,0],[5,0],[-5,5],[0,5],[5,5]])
         screenRes = [1360,768]
         screenSize = [410,230]
         viewDist = 830 # viewing distance in mm
+        geometry = monitorGeometry.MonitorGeometry(screenSize, screenRes, viewDist)
 
 
 
@@ -73,6 +109,21 @@ if __name__ == '__main__':
     # eye fixations)
     fixThreshold = 3.1
 
+    # Time between reads of the tracker buffer (in S) - new samples are only
+    # read once, so there is no need to read faster than they arrive
+    pollInterval = 0.01
+
+    # Adaptive calibration: a target that timed out is shown again at the end
+    # (up to maxRetries more times, only for the eye that missed it), and the
+    # calibration stops as soon as the held out error of every tracked eye is
+    # within errThreshold once minTargets targets have a fixation for both
+    # eyes and they cover every edge row and column of the grid.
+    # Set adaptive to False to show every target once, as before.
+    adaptive = True
+    maxRetries = 1
+    minTargets = 9
+    errThreshold = 0.5 # degrees of visual angle
+
     # Define the diameter of the fixation points (in degrees of visual angle)
     fixDotInDeg = calibTargRad#0.3 # inner circle
     fixDotOutDeg = 2.0*calibTargRad#0.6 # outer circle
@@ -85,24 +136,17 @@ if __name__ == '__main__':
     for x in range(0,s[0]):
         targetsDeg2[x] = targetsDeg[order[x]]
 
-    # Calculate pixel size (in mm) assuming square pixels
-    pixSize = float(screenSize[0])/float(screenRes[0])
-
-    # Caliculate millimetres per degree (NB. Only accurate for small eye angles)
-    MMperDeg = math.tan(1/(180/math.pi))*viewDist
-
-    # Calculate pixels per degree
-    pixPerDeg = MMperDeg/pixSize
+    # Pixels per degree at the centre of the screen, only used to report the
+    # calibration error in degrees (positions use the exact transforms)
+    pixPerDeg = geometry.pixPerDeg[0]
 
     # Target locations in screen pixel coordinates
     cnrTarget = [0,0]
-    tgtLocs = targetsDeg2.astype(float)
-    tgtLocs[:,0] = np.round(targetsDeg2[:,0]*pixPerDeg+cnrTarget[0])
-    tgtLocs[:,1] = np.round(targetsDeg2[:,1]*pixPerDeg+cnrTarget[1])
+    tgtLocs = np.round(geometry.posDeg2Pix(targetsDeg2)+cnrTarget)
 
     # Calculate the diameter of the fixation points (in pixels on the monitor)
-    fixDotInPix = fixDotInDeg*pixPerDeg
-    fixDotOutPix = fixDotOutDeg*pixPerDeg
+    fixDotInPix = float(geometry.sizeDeg2Pix(fixDotInDeg))
+    fixDotOutPix = float(geometry.sizeDeg2Pix(fixDotOutDeg))
 
 
     # %% Setup LiveTrack
@@ -138,7 +182,11 @@ if __name__ == '__main__':
     GlintXR = [None] * s[0]
     GlintYR = [None] * s[0]
 
-    for i in range(0,s[0]):
+    queue = list(range(0,s[0])) # targets still to show, in order
+    shown = [0] * s[0]
+    while queue:
+        i = queue.pop(0)
+        shown[i] += 1
         # plot a circle at the fixation position.
         dot = visual.Circle(win,units='pix',radius=fixDotOutPix/2,fillColor=[-1] * 3,lineColor=[-1] * 3,pos=[tgtLocs[i,0],tgtLocs[i,1]]) # outer circle
         dot.draw()
@@ -147,60 +195,37 @@ if __name__ == '__main__':
         win.flip()
 
         # This flag will be set to true when a valid fixation has been acquired
-        gotFixLeft = 0;
-        gotFixRight = 0;
+        # (already true for an eye that got it when the target was shown before)
+        gotFixLeft = int(VectXL[i] is not None);
+        gotFixRight = int(VectXR[i] is not None);
+
+        # Only samples from this dot on count, each is read from the buffer
+        # once into the fixation windows of both eyes (see fixationDetector)
+        LiveTrack.ClearDataBuffer()
+        detector = fixationDetector.FixationDetector(fixDurSamples, fixThreshold)
 
         t0 = time.time() # reset fixation timer
 
         # Loop until fixation data has been aquired for this dot (or timed out)
         while 1:
-            d = LiveTrack.GetBufferedEyePositions(0,fixDurSamples,0)
-            VectX = LiveTrack.GetFieldAsList(d,'VectX')
-            VectY = LiveTrack.GetFieldAsList(d,'VectY')
-            GlintX = LiveTrack.GetFieldAsList(d,'GlintX')
-            GlintY = LiveTrack.GetFieldAsList(d,'GlintY')
-            Tracked = LiveTrack.GetFieldAsList(d,'Tracked')
-            VectXRight = LiveTrack.GetFieldAsList(d,'VectXRight')
-            VectYRight = LiveTrack.GetFieldAsList(d,'VectYRight')
-            GlintXRight = LiveTrack.GetFieldAsList(d,'GlintXRight')
-            GlintYRight = LiveTrack.GetFieldAsList(d,'GlintYRight')
-            TrackedRight = LiveTrack.GetFieldAsList(d,'TrackedRight')
-
-            # Calculate the maximum difference in the pupil-to-glint
-            # vectors for the samples in the buffer, for left eye
-            pgDistL = max([max(VectX)-min(VectX),max(VectY)-min(VectY)])
+            detector.update(LiveTrack.GetBufferedEyePositions(fromBeginning=0,removeFromBuffer=1))
+
+            # Check if the last fixDurSamples samples are all tracked, their
+            # pupil-to-glint vectors moved less than the defined limit for a
+            # fixation (fixThreshold), and the time to wait for fixations
+            # (setupDelay) has passed, for the left eye
+            if detector.isFixation(0) and (time.time()-t0)>setupDelay/1000 and gotFixLeft==0:
+                # save the data for this fixation
+                VectXL[i],VectYL[i],GlintXL[i],GlintYL[i] = detector.medians(0)
+                print('Fixation #',str(i+1),': Found valid fixation for left eye')
+                gotFixLeft = 1 # good fixation aquired
 
             # and for the right eye
-            pgDistR = max([max(VectXRight)-min(VectXRight),max(VectYRight)-min(VectYRight)])
-
-            # Check if the maximum vector difference is within the defined
-            # limit for a fixation (fixWindow) and all samples are tracked, and
-            # the time to wait for fixations (waitTimeForFix) has passed, for
-            # the left eye
-            if pgDistL<=fixThreshold and np.all(Tracked) and (time.time()-t0)>setupDelay/1000:
-                # Check if there are enough samples in the buffer for the
-                # defined duration (fixDurSamples)
-                if len(d)>=fixDurSamples and gotFixLeft==0:
-                    # save the data for this fixation
-                    VectXL[i] = np.median(VectX)
-                    VectYL[i] = np.median(VectY)
-                    GlintXL[i] = np.median(GlintX)
-                    GlintYL[i] = np.median(GlintY)
-                    print('Fixation #',str(i+1),': Found valid fixation for left eye')
-                    gotFixLeft = 1 # good fixation aquired
-
-            # and for the right eye
-            if pgDistR<=fixThreshold and np.all(TrackedRight) and (time.time()-t0)>setupDelay/1000:
-                # Check if there are enough samples in the buffer for the
-                # defined duration (fixDurSamples)
-                if  len(d)>=fixDurSamples and gotFixRight==0:
-                    # save the data for this fixation
-                    VectXR[i] = np.median(VectXRight)
-                    VectYR[i] = np.median(VectYRight)
-                    GlintXR[i] = np.median(GlintXRight)
-                    GlintYR[i] = np.median(GlintYRight)
-                    print('Fixation #',str(i+1),': Found valid fixation for right eye')
-                    gotFixRight = 1 # good fixation aquired
+            if detector.isFixation(1) and (time.time()-t0)>setupDelay/1000 and gotFixRight==0:
+                # save the data for this fixation
+                VectXR[i],VectYR[i],GlintXR[i],GlintYR[i] = detector.medians(1)
+                print('Fixation #',str(i+1),': Found valid fixation for right eye')
+                gotFixRight = 1 # good fixation aquired
 
             if (time.time()-t0)>fixTimeout:
                 if not gotFixLeft and trackLeftEye>0:
@@ -215,6 +240,29 @@ if __name__ == '__main__':
                 win.flip()
                 break
 
+            # wait for new samples instead of spinning on the buffer
+            time.sleep(pollInterval)
+
+        if adaptive:
+            # show a failed target again at the end
+            missed = (not gotFixLeft and trackLeftEye) or (not gotFixRight and trackRightEye)
+            if missed and shown[i] <= maxRetries:
+                queue.append(i)
+            # stop early once the targets so far calibrate well enough
+            nGot = sum(1 for k in range(0,s[0]) if (VectXL[k] is not None or not trackLeftEye)
+                       and (VectXR[k] is not None or not trackRightEye))
+            if queue and nGot >= minTargets:
+                # judged on the held out error of the local models, the
+                # device is only calibrated once below with every accepted target
+                errors = []
+                if trackLeftEye:
+                    errors.append(validationError(tgtLocs, VectXL, VectYL)[1]/pixPerDeg)
+                if trackRightEye:
+                    errors.append(validationError(tgtLocs, VectXR, VectYR)[1]/pixPerDeg)
+                if errors and max(errors) <= errThreshold:
+                    print('Calibration error',errors,'degrees after',str(nGot),'targets, skipping',str(len(queue)),'targets')
+                    break
+
 
     # close the PsychoPy window
     win.close()
@@ -260,8 +308,8 @@ if __name__ == '__main__':
 
     if trackRightEye:
         calErrR = LiveTrack.CalibrateDevice(1, len(tgtLocsXR), tgtLocsXR, tgtLocsYR, VectXR, VectYR, viewDist, np.median(GlintXR), np.median(GlintYR))
-        print('Left eye calibration accuraccy: ',str(math.sqrt(float(calErrR)/len(tgtLocsXR))), 'pixels')
-        print('Left eye calibration accuraccy: ',str(math.sqrt(float(calErrR)/len(tgtLocsXR))/pixPerDeg), 'degrees of visual angle')
+        print('Right eye calibration accuraccy: ',str(math.sqrt(float(calErrR)/len(tgtLocsXR))), 'pixels')
+        print('Right eye calibration accuraccy: ',str(math.sqrt(float(calErrR)/len(tgtLocsXR))/pixPerDeg), 'degrees of visual angle')
 
     # %% plot the estimated fixation locations for the calibration
 
@@ -271,12 +319,41 @@ if __name__ == '__main__':
     #if trackRightEye:
     #    [gazeXR, gazeYR] = LiveTrack.CalcGaze(1, len(tgtLocsXR), VectXR, VectYR)
 
-    gazeXL = [x+10 for x in tgtLocsXL]
-    gazeYL = [x+10 for x in tgtLocsYL]
-    gazeXR = [x-10 for x in tgtLocsXR]
-    gazeYR = [x-10 for x in tgtLocsYR]
+    # %% fit the local gaze models on the same points (see gazeModel)
+
+    points = {}
+    if trackLeftEye:
+        points['left'] = {'targetX': tgtLocsXL, 'targetY': tgtLocsYL, 'VectX': VectXL,
+                          'VectY': VectYL, 'GlintX': GlintXL, 'GlintY': GlintYL}
+    if trackRightEye:
+        points['right'] = {'targetX': tgtLocsXR, 'targetY': tgtLocsYR, 'VectX': VectXR,
+                           'VectY': VectYR, 'GlintX': GlintXR, 'GlintY': GlintYR}
+    models = gazeModel.fitCalibration(points)
+    for eye in models:
+        print(eye.capitalize(),'eye local model accuraccy: ',str(models[eye]['rmsError']), 'pixels')
+
+    # estimated fixation locations of the targets, from the local models
+    if 'left' in models:
+        [gazeXL, gazeYL] = gazeModel.mapGaze(models['left'], VectXL, VectYL)
+    if 'right' in models:
+        [gazeXR, gazeYR] = gazeModel.mapGaze(models['right'], VectXR, VectYR)
+
+    calibration = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                   'screenRes': [int(x) for x in screenRes],
+                   'screenSize': [float(x) for x in screenSize],
+                   'viewDist': float(viewDist),
+                   'points': points,
+                   'models': models}
+    if calibrationPath is not None:
+        gazeModel.saveCalibration(calibrationPath, calibration)
 
     LiveTrack.SetResultsTypeCalibrated()
 
     if useVideo:
         LiveTrackGS.VideoStop()
+
+    return calibration
+
+
+if __name__ == '__main__':
+    main()
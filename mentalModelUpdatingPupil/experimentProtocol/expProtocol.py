@@ -10,19 +10,34 @@ Pupil Response".
 """
 # =============================================================================
 
-import numpy as np
+import json
 import random
-import pandas as pd
-import LiveTrack as lt
-import pickle
-import calibrate
-import psychtoolbox as ptb
-from psychopy import visual, core, event, gui, prefs
-prefs.hardware['audioLib'] = ['PTB']
-from psychopy import sound
-from time import sleep
+import sys
+import eyeRecorder
+import eyeDrain
+import qualityMonitor
+import trialWriter
+import trialRecord
+import screenTiming
+import trialDesign
+import scheduleStore
+import stimulusCache
+# '--headless' runs a simulated participant without hardware (see headless)
+headlessRun = '--headless' in sys.argv
+if headlessRun:
+    import headless
+    import simLiveTrack as lt
+    from headless import visual, core, event, gui, sound
+else:
+    import LiveTrack as lt
+    import calibrate
+    import psychtoolbox as ptb
+    from psychopy import visual, core, event, gui, prefs
+    prefs.hardware['audioLib'] = ['PTB']
+    from psychopy import sound
 from threading import Thread
-from copy import deepcopy
+from queue import Queue, Full
+from time import perf_counter, strftime
 from os import makedirs, umask
 
 print(sound.Sound)
@@ -36,11 +51,13 @@ win0 = visual.Window(size=(600, 600),
                      units='deg',
                      screen=1
                      )
+# every stimulus is built once here and reused (see stimulusCache)
+stimCache = stimulusCache.StimulusCache(win0, visual.TextStim)
 
 # Visual elements
 # fixation dot
 
-fixStim = visual.Circle(win=win0, radius=0.4, edges=32, fillColor='white')
+fixStim = stimCache.add('fixStim', visual.Circle, radius=0.4, edges=32, fillColor='white')
 
 # shape/color stimuli
 sqSize = 10
@@ -48,14 +65,14 @@ cirSize = 5
 stimLineW = 2
 blueVal = [0, 0, 1]
 greenVal = [0, 0.5, 0]
-stim_BluSqr = visual.Rect(win=win0,
-                          size=sqSize,
-                          fillColor=blueVal,
-                          lineColor=(-1, -1, -1),
-                          lineWidth=stimLineW
-                          )
-
-stim_BluCir = visual.Circle(win=win0,
+stim_BluSqr = stimCache.add('stim_BluSqr', visual.Rect,
+                            size=sqSize,
+                            fillColor=blueVal,
+                            lineColor=(-1, -1, -1),
+                            lineWidth=stimLineW
+                            )
+
+stim_BluCir = stimCache.add('stim_BluCir', visual.Circle,
                             size=cirSize,
                             fillColor=blueVal,
                             lineColor=(-1, -1, -1),
@@ -63,14 +80,14 @@ stim_BluCir = visual.Circle(win=win0,
                             lineWidth=stimLineW
                             )
 
-stim_GreSqr = visual.Rect(win=win0,
-                          size=sqSize,
-                          fillColor=greenVal,
-                          lineColor=(-1, -1, -1),
-                          lineWidth=stimLineW
-                          )
+stim_GreSqr = stimCache.add('stim_GreSqr', visual.Rect,
+                            size=sqSize,
+                            fillColor=greenVal,
+                            lineColor=(-1, -1, -1),
+                            lineWidth=stimLineW
+                            )
 
-stim_GreCir = visual.Circle(win=win0,
+stim_GreCir = stimCache.add('stim_GreCir', visual.Circle,
                             size=cirSize,
                             fillColor=greenVal,
                             lineColor=(-1, -1, -1),
@@ -81,32 +98,65 @@ stim_GreCir = visual.Circle(win=win0,
 stim = 0
 
 # buttons for shape/color selection
-downNotSelect = visual.ImageStim(win=win0,
-                                 image="images/downNotSelect.png",
-                                 pos=(0, -2)
-                                 )
-
-upNotSelect = visual.ImageStim(win=win0,
-                               image="images/upNotSelect.png",
-                               pos=(0, 2)
-                               )
-
-
-downSelect = visual.ImageStim(win=win0,
-                              image="images/downSelect.png",
+downNotSelect = stimCache.add('downNotSelect', visual.ImageStim,
+                              image="images/downNotSelect.png",
                               pos=(0, -2)
                               )
 
-upSelect = visual.ImageStim(win=win0,
-                            image="images/upSelect.png",
+upNotSelect = stimCache.add('upNotSelect', visual.ImageStim,
+                            image="images/upNotSelect.png",
                             pos=(0, 2)
                             )
 
+
+downSelect = stimCache.add('downSelect', visual.ImageStim,
+                           image="images/downSelect.png",
+                           pos=(0, -2)
+                           )
+
+upSelect = stimCache.add('upSelect', visual.ImageStim,
+                         image="images/upSelect.png",
+                         pos=(0, 2)
+                         )
+
+# reference stimuli of both versions, versionChange picks the pair to show
+refSize = 2
+refPos = 5
+stimCache.add(('refStimUp', 0), visual.Rect,
+              size=refSize * 2,
+              fillColor=greenVal,
+              lineColor=(-1, -1, -1),
+              lineWidth=stimLineW,
+              pos=(0, refPos)
+              )
+stimCache.add(('refStimDown', 0), visual.Circle,
+              size=refSize,
+              fillColor=blueVal,
+              lineColor=(-1, -1, -1),
+              edges=99,
+              lineWidth=stimLineW,
+              pos=(0, -refPos)
+              )
+stimCache.add(('refStimUp', 1), visual.Circle,
+              size=refSize,
+              fillColor=blueVal,
+              lineColor=(-1, -1, -1),
+              edges=99,
+              lineWidth=stimLineW,
+              pos=(0, refPos)
+              )
+stimCache.add(('refStimDown', 1), visual.Rect,
+              size=refSize * 2,
+              fillColor=greenVal,
+              lineColor=(-1, -1, -1),
+              lineWidth=stimLineW,
+              pos=(0, -refPos)
+              )
 refStimUp = None
 refStimDown = None
 
 # confidence rating bar
-confRatingScale = visual.Slider(win=win0, name='slider',
+confRatingScale = stimCache.add('confRatingScale', visual.Slider, name='slider',
                                 size=(10, 1), pos=(0, 0),
                                 labels=None, ticks=(0, 20),
                                 granularity=0, style=('slider',),
@@ -115,25 +165,25 @@ confRatingScale = visual.Slider(win=win0, name='slider',
 
 scaleLabelList = ["COLOR", "SHAPE"]
 
-scaleLabelLeft = visual.TextStim(win=win0,
-                                 text=None,
-                                 pos=(-7, 0),
-                                 height=0.6,
-                                 color=(1, 1, 1))
+scaleLabelLeft = stimCache.add('scaleLabelLeft', visual.TextStim,
+                               text=None,
+                               pos=(-7, 0),
+                               height=0.6,
+                               color=(1, 1, 1))
 
-scaleLabelRight = visual.TextStim(win=win0,
-                                  text=None,
-                                  pos=(7, 0),
-                                  height=0.6,
-                                  color=(1, 1, 1))
+scaleLabelRight = stimCache.add('scaleLabelRight', visual.TextStim,
+                                text=None,
+                                pos=(7, 0),
+                                height=0.6,
+                                color=(1, 1, 1))
 
 # feedback
 # audio
 soundList = ['sound/sine700_0_5.wav', 'sound/sine400_0_8.wav']
 
-noResp = visual.TextStim(win=win0,
-                         text="No response!\nThis trial is skipped."
-                         )
+noResp = stimCache.add('noResp', visual.TextStim,
+                       text="No response!\nThis trial is skipped."
+                       )
 
 # debugging variables
 doIntro = True
@@ -142,11 +192,12 @@ doExp = True
 doSave = True
 
 # points screen
-pointsScreen = visual.TextStim(win=win0, text="= 0")
+pointsScreen = stimCache.add('pointsScreen', visual.TextStim, text="")
 
 # arrays
 stimList = [stim_BluSqr, stim_BluCir, stim_GreSqr, stim_GreCir]
-probConds = [0.75, 0.90]
+stimIndex = 0   # index in stimList of the stimulus of the current trial
+forcedErrorList = []    # forced error of each trial, from the schedule
 
 dictInfo = {'version': 0, 'partID': "", 'gender': "m/f", 'age': "",
             'mascara': "y/n", 'glasses': "y/n", 'contactLens': "y/n",
@@ -158,20 +209,42 @@ trialDataKeys = ['trialTotal', 'blockTrial', 'block', 'contingentCond',
                  'confRating', 'pointsStartTime', 'pointsEndTime', 'stimStartTime',
                  'stimEndTime', 'respStartTime', 'respEndTime', 'fixStartTime',
                  'fixEndTime', 'feedbackStartTime', 'feedbackEndTime', 'noRespStartTime',
-                 'noRespEndTime', 'choiceHist', 'ratingHist', 'points']
-
-trialDataDict = dict.fromkeys(trialDataKeys)
+                 'noRespEndTime'] + \
+                screenTiming.frameStatKeys(['points', 'stim', 'resp', 'noResp',
+                                            'feedback']) + \
+                ['choiceHist', 'ratingHist', 'points']
+
+# columns of the trial data CSV
+trialColumns = (['partID', 'session', 'version', 'scheduleSeed'] + trialDataKeys +
+                ['gender', 'age', 'mascara', 'glasses', 'contactLens'])
+
+# trial data is kept in a fixed-slot record (see trialRecord), histories go
+# into session-long append-only logs: [choice, time] and (rating, time) rows
+TrialRecord = trialRecord.makeRecordType('TrialRecord', trialDataKeys)
+choiceLog = trialRecord.HistoryLog((int, float), list)
+ratingLog = trialRecord.HistoryLog((float, float), tuple)
+
+trialDataDict = TrialRecord()
 trialDataDict['points'] = 0
 trialDataDict['trialTotal'] = -1
 
 participantNumber = 123  # participand number code (dummy for now)
 trialNumbTotal = 0
 
-# switches for backup thread
-backupCheck = True  # switch to keep backup thread going
-trialCheck = False  # switch to trigger backup to initiate
+# queue handing finished trials to the backup thread, None shuts it down
+# when the backup thread falls this many trials behind, the trial loop waits
+saveQueue = Queue(maxsize=4)
+saveErrors = []     # exception that stopped the backup thread (see queueTrial)
+saveTimeout = 0.5   # seconds between checks of the backup thread while waiting
+saveSyncEvery = 10  # trials between syncs of the trial CSV (see trialWriter)
+scheduleDB = 'data/schedules.sqlite'    # pregenerated schedules (see scheduleStore)
+schedule = None
+saveTimes = []      # wall time each trial took to save (s)
+saveLatencies = []  # wall time from the end of each trial until it was saved (s)
 
 refreshRate = int(round(win0.getActualFrameRate()))
+frameTimer = screenTiming.FrameTimer(refreshRate)     # flip intervals per screen
+scheduler = screenTiming.ScreenScheduler(win0, refreshRate)  # screen deadlines
 
 # text variables
 # Instruction section texts
@@ -267,14 +340,36 @@ calibStartText = """
     Please do not move your eyes to a different part of the screen until the next dot appears.
     Press [Space] to start."""
 
+qualityText = """
+    The eye tracking got worse:\n
+    {}\n
+    Press [c] to calibrate or [Space] to continue."""
+
 calibEndText = """
     Calibration finished.\n
     Press [Space] to continue with the experiment."""
 
+# text screens, built once under their variable name (height None is default)
+for textName, text, height in [
+        ('introText1', introText1, 0.9), ('introText2', introText2, 0.9),
+        ('introText3', introText3, 0.9), ('introText3v2', introText3v2, 0.9),
+        ('introText4', introText4, 0.9), ('introText5', introText5, 0.8),
+        ('introText5v2', introText5v2, 0.8),
+        ('practiceText1', practiceText1, 0.9), ('practiceText2', practiceText2, 0.9),
+        ('practiceText2v2', practiceText2v2, 0.9),
+        ('practiceText3', practiceText3, 0.9), ('practiceText4', practiceText4, 0.9),
+        ('expText1', expText1, None), ('expText2', expText2, None),
+        ('breakText', breakText, 0.9),
+        ('calibStartText', calibStartText, 0.9), ('calibEndText', calibEndText, 0.9),
+        ('qualityText', qualityText, 0.9),
+        ('shutDownText', "Shuting Down...", None),
+        ('endText', "", 0.9)]:
+    stimCache.addText(textName, text, height=height)
+
 
 # Misc Commands
 def shutDown():
-    visual.TextStim(win=win0, text="Shuting Down...")
+    stimCache['shutDownText'].draw()
     win0.flip()
     lt.StopTracking()
     lt.Close()
@@ -283,115 +378,42 @@ def shutDown():
 
 
 def doCalibrate():
-    visual.TextStim(win=win0, text=f"{calibStartText}", height=0.9).draw()
+    stimCache['calibStartText'].draw()
     win0.flip()
     keys = event.waitKeys(keyList=['space'])
     win0.flip()
-    calibrate.main()
-    visual.TextStim(win=win0, text=f"{calibEndText}", height=0.9).draw()
+    # the calibration points and local gaze models are kept with the session
+    calibrate.main(f"data/{dictInfo['partID']}/{dictInfo['partID']}_{dictInfo['session#']}calibration{strftime('%H%M%S')}.json")
+    stimCache['calibEndText'].draw()
     win0.flip()
     keys = event.waitKeys(keyList=['space'])
     win0.flip()
 
 
+def qualityCheck():
+    '''Between blocks: shows the operator why the eye data of the last minute
+    was poor (see qualityMonitor), if it was, and offers to recalibrate.'''
+    print(f"eye data quality: {eyeQuality.stats()}")
+    problems = eyeQuality.problems()
+    if not problems:
+        return
+    stimCache.text('qualityText', qualityText.format('\n'.join(problems))).draw()
+    win0.flip()
+    keys = event.waitKeys(keyList=['c', 'space'])
+    win0.flip()
+    if keys[-1] == 'c':
+        # calibrate reads the tracker buffer itself
+        eyeDataDrain.pause()
+        doCalibrate()
+        eyeDataDrain.resume()
+        eyeQuality.reset()
+
+
 def getdict(struct):
     # this function returns a dictionary of the cython data structure (eye data)
     return dict((field, getattr(struct, field)) for field, _ in struct._fields_)
 
 
-# Helper Functions
-def randIntNoRepeat(numb, min, max):
-    """Function to create a list of integers that do not repeat subsequently.
-    This is being used to create a list of which stimulus to present.
-    Input: number of elements,
-           minimum integer value
-           maximum integer value
-    Output: a list of
-    """
-    outList = []
-    for i in range(numb):
-        if len(outList) == 0:
-            outList.append(random.randint(min, max))
-        else:
-            while True:
-                pick = random.randint(min, max)
-                if outList[-1] != pick:
-                    outList.append(pick)
-                    break
-    return outList
-
-
-def randIntListSetTotal(nVal=1, meanVal=0, minVal=0, maxVal=0, reapVal=0):
-    """Returns a list of random integers This funciton generates a list of random
-    integers from a normal distribution with a mean(meanVal), miminum(minVal),
-    and maximum(maxVal) values.
-    The sum of the list will == the product of mean(meanVal) and number of
-    elements(nVal) specified.
-    """
-    total = nVal * meanVal
-    if maxVal == 0:     # if no max value is specified it will default to total
-                        # thus impossible to be met.
-        maxVal = total
-    while True:         # loop indefinitely (exit condition later)
-        outputList = []
-        # initial an empty list to be filled with our random values
-        for i in range(nVal):
-            # this loop will be as long as the number of value
-            # specified (default to 1)
-            if i == 0:
-                outputList.append(random.randrange(minVal, maxVal))
-                # appends a random integer between min and max value
-            else:
-                while True:
-                    tempInt = random.randrange(minVal, maxVal)
-                    if abs(outputList[-1] - tempInt) >= reapVal:
-                        outputList.append(tempInt)
-                        break
-        if sum(outputList) == total:
-            # if sum of the values meets desired total value, exit the loop
-            break
-    return(outputList)
-
-
-def makeContingentBlockList(input):
-    """Return a list of alternating 0s and 1s
-    start of the sequence will be random, the list will be used to map the
-    contingent condition (0 == shape, 1 == color)
-    """
-    outputList = []     # initiate an empty list
-    outputList.append(np.random.randint(2))     # make first element random
-    # since first element is alread set, loop for 1 element less
-    for i in range(len(input) - 1):
-        if outputList[-1] == 0:     # if last element is 0, append 1
-            outputList.append(1)
-        else:
-            outputList[-1] == 1     # if last element is 1, append 0
-            outputList.append(0)
-    return outputList
-
-
-def makeProbabilityConditionList(input):
-    """Returns a list alternating values from the probability list
-    in my case, the two values represent high and low probability conditions,
-    probConds = [0.75,0.90]
-    """
-    while True:
-        outputList = []     # initiate empty list
-        for i in range(len(input)):     # iterate the length of input list
-            if (i % 2) == 0:  # determine if element position is even (if divisible by 2)
-                            # 0 is considered even
-                # set prob to a random integer (0 or 1)
-                prob = random.randint(0, 1)
-                outputList.append(prob)  # append list with new prob value
-            elif (i % 2) == 1:    # if element position is odd
-                # append list with the same prob value as before
-                outputList.append(prob)
-        avgList = sum(outputList) / len(outputList)
-        if avgList > 0.3 and avgList < 0.7:
-            break
-    return outputList
-
-
 def debugging():
     global doIntro
     global doPractice
@@ -421,25 +443,25 @@ def debugging():
 
 
 def introduction():
-    visual.TextStim(win=win0, text=f"{introText1}", height=0.9).draw()
+    stimCache['introText1'].draw()
     win0.flip()
     keys = event.waitKeys(keyList=['space'])
-    visual.TextStim(win=win0, text=f"{introText2}", height=0.9).draw()
+    stimCache['introText2'].draw()
     win0.flip()
     keys = event.waitKeys(keyList=['space'])
     if dictInfo['version'] == 0:
-        visual.TextStim(win=win0, text=f"{introText3}", height=0.9).draw()
+        stimCache['introText3'].draw()
     elif dictInfo['version'] == 1:
-        visual.TextStim(win=win0, text=f"{introText3v2}", height=0.9).draw()
+        stimCache['introText3v2'].draw()
     win0.flip()
     keys = event.waitKeys(keyList=['space'])
-    visual.TextStim(win=win0, text=f"{introText4}", height=0.9).draw()
+    stimCache['introText4'].draw()
     win0.flip()
     keys = event.waitKeys(keyList=['space'])
     if dictInfo['version'] == 0:
-        visual.TextStim(win=win0, text=f"{introText5}", height=0.8).draw()
+        stimCache['introText5'].draw()
     elif dictInfo['version'] == 1:
-        visual.TextStim(win=win0, text=f"{introText5v2}", height=0.8).draw()
+        stimCache['introText5v2'].draw()
     win0.flip()
     keys = event.waitKeys(keyList=['space', 'r'])
     if keys[-1] == 'r':
@@ -448,7 +470,7 @@ def introduction():
 
 def breakSection():
     lt.StopTracking()
-    visual.TextStim(win=win0, text=f"{breakText}", height=0.9).draw()
+    stimCache['breakText'].draw()
     win0.flip()
     keys = event.waitKeys(keyList=['space'])
     lt.StartTracking()
@@ -460,17 +482,21 @@ def percentFixationScreen(duration=1):
     """
     trialDataDict['pointsStartTime'] = lt.GetLastResult().Timestamp
     if trialDataDict['trialTotal'] == 0:
-        pointsScreen = visual.TextStim(win=win0, text='')
+        stimCache.text('pointsScreen', '')
     else:
         percent = round(
             trialDataDict['points'] / ((trialDataDict['trialTotal']) * 10) * 100, 2)
-        pointsScreen = visual.TextStim(win=win0, text=f"{percent}%")
-    for frameN in range(duration * refreshRate):
+        stimCache.text('pointsScreen', f"{percent}%")
+    frameTimer.reset()
+    scheduler.start(duration)
+    while scheduler.running():
         if event.getKeys(keyList=['escape']):
+            scheduler.stop()
             break
         pointsScreen.draw()
-        win0.flip()
+        frameTimer.record(win0.flip())
     trialDataDict['pointsEndTime'] = lt.GetLastResult().Timestamp
+    frameTimer.store(trialDataDict, 'points')
 
 
 def stimulusScreen(duration=2):
@@ -478,19 +504,25 @@ def stimulusScreen(duration=2):
     Stimulus is chosn from a list of stimuli named "stimList"
     """
     global stim
+    global stimIndex
     # choose a random stimulus from the stimulus list
     if doPractice == True:
-        stim = stimList[trialDataDict['blockTrial']]
+        stimIndex = trialDataDict['blockTrial']
     else:
         trialDataDict['stimDisplayed'] = stimSequence[trialDataDict['trialTotal']]
-        stim = stimList[trialDataDict['stimDisplayed']]
+        stimIndex = trialDataDict['stimDisplayed']
+    stim = stimList[stimIndex]
     trialDataDict['stimStartTime'] = lt.GetLastResult().Timestamp
-    for frameN in range(duration * refreshRate):
+    frameTimer.reset()
+    scheduler.start(duration)
+    while scheduler.running():
         if event.getKeys(keyList=['escape']):
+            scheduler.stop()
             break
         stim.draw()
-        win0.flip()
+        frameTimer.record(win0.flip())
     trialDataDict['stimEndTime'] = lt.GetLastResult().Timestamp
+    frameTimer.store(trialDataDict, 'stim')
 
 
 def responseScreen(duration=5):
@@ -507,13 +539,16 @@ def responseScreen(duration=5):
     buttonCheck = False     # tracks if button choice has been made
     down = False
     up = False
-    choiceList = []
+    choiceStart = choiceLog.n   # this trial's choices start here in the log
     timer = core.Clock()
     # keeps looping while responses are not made and before the end of duration
     trialDataDict['respStartTime'] = lt.GetLastResult().Timestamp
-    for frameN in range(duration * refreshRate) or responseCheck == False:
+    frameTimer.reset()
+    scheduler.start(duration)
+    while scheduler.running():
         # exit loop if 'escape' pressed
         if event.getKeys(keyList=['escape']):
+            scheduler.stop()
             break
         # when no choice is made
         if buttonCheck == False:
@@ -525,7 +560,7 @@ def responseScreen(duration=5):
             buttonCheck = True
             trialDataDict['choice'] = 1  # Up
             if up == False:
-                choiceList.append([trialDataDict['choice'], timer.getTime()])
+                choiceLog.append([trialDataDict['choice'], timer.getTime()])
                 up = True
                 down = False
         # signal that 'Down' was chosen
@@ -534,7 +569,7 @@ def responseScreen(duration=5):
             buttonCheck = True
             trialDataDict['choice'] = 0  # Down
             if down == False:
-                choiceList.append([trialDataDict['choice'], timer.getTime()])
+                choiceLog.append([trialDataDict['choice'], timer.getTime()])
                 up = False
                 down = True
         # check if a choice was made
@@ -552,7 +587,12 @@ def responseScreen(duration=5):
         scaleLabelRight.draw()
         refStimUp.draw()
         refStimDown.draw()
-        win0.flip()
+        frameTimer.record(win0.flip())
+        # exit loop once both the choice and the rating are made
+        if buttonCheck == True and confRatingScale.getRating() is not None:
+            responseCheck = True
+            scheduler.stop()
+            break
 
         # AUTOMATION
    # buttonCheck = True
@@ -561,26 +601,32 @@ def responseScreen(duration=5):
         # REVERT BELOW COMMAND WHEN NOT AUTOMATING: confRatingValue
 
     trialDataDict['confRating'] = confRatingScale.getRating()
-    trialDataDict['ratingHist'] = confRatingScale.getHistory()
+    ratingStart = ratingLog.n
+    ratingLog.extend(confRatingScale.getHistory())
+    trialDataDict['ratingHist'] = ratingLog.span(ratingStart)
     if buttonCheck == False or trialDataDict['confRating'] == None:
         trialDataDict['respSuccess'] = 0
     else:
         responseCheck = True
         trialDataDict['respSuccess'] = 1
-        trialDataDict['choiceHist'] = choiceList
+        trialDataDict['choiceHist'] = choiceLog.span(choiceStart)
         trialDataDict['noRespStartTime'] = None
         trialDataDict['noRespEndTime'] = None
+        frameTimer.clear(trialDataDict, 'noResp')
     # else error screen
     confRatingScale.reset()  # reset for next input
     trialDataDict['respEndTime'] = lt.GetLastResult().Timestamp
+    frameTimer.store(trialDataDict, 'resp')
 
 
 def noRespScreen(duration=3):
     switch = True
     trialDataDict['noRespStartTime'] = lt.GetLastResult().Timestamp
-    for frameN in range(duration * refreshRate):
+    frameTimer.reset()
+    scheduler.start(duration)
+    while scheduler.running():
         noResp.draw()
-        win0.flip()
+        frameTimer.record(win0.flip())
         if switch == True:
             trialDataDict['isCorrect'] = None
             trialDataDict['isForcedError'] = None
@@ -591,61 +637,28 @@ def noRespScreen(duration=3):
             trialDataDict['fixEndTime'] = None
             trialDataDict['feedbackStartTime'] = None
             trialDataDict['feedbackEndTime'] = None
+            frameTimer.clear(trialDataDict, 'feedback')
             switch = False
     trialDataDict['noRespEndTime'] = lt.GetLastResult().Timestamp
+    frameTimer.store(trialDataDict, 'noResp')
 
 
 def determineFeedback():
     global respSound
-
-    # looks up the current contingent (color or shape)
-    # if current contingent is color, set the correct answer to be based on color
-    if trialDataDict['contingentCond'] == 0:  # 0 == color
-        if stim == stim_BluSqr or stim == stim_BluCir:
-            if dictInfo['version'] == 0:
-                trialDataDict['correctAnswer'] = 0  # 0 == down
-            elif dictInfo['version'] == 1:
-                trialDataDict['correctAnswer'] = 1  # 1 == up
-        elif stim == stim_GreSqr or stim == stim_GreCir:
-            if dictInfo['version'] == 0:
-                trialDataDict['correctAnswer'] = 1  # 1 == up
-            elif dictInfo['version'] == 1:
-                trialDataDict['correctAnswer'] = 0  # 0 == down
-
-    # if current contingent is shape, set the correct answer to be based on shape
-    elif trialDataDict['contingentCond'] == 1:  # 1 == shape
-        if stim == stim_BluSqr or stim == stim_GreSqr:
-            if dictInfo['version'] == 0:
-                trialDataDict['correctAnswer'] = 1  # 1 == up
-            elif dictInfo['version'] == 1:
-                trialDataDict['correctAnswer'] = 0  # 0 == down
-        elif stim == stim_BluCir or stim == stim_GreCir:
-            if dictInfo['version'] == 0:
-                trialDataDict['correctAnswer'] = 0  # 0 == down
-            elif dictInfo['version'] == 1:
-                trialDataDict['correctAnswer'] = 1  # 1 == up
+    version = dictInfo['version']
+    # looks up the correct answer for the current contingent (color or shape)
+    # and stimulus (see trialDesign.correctAnswerTable)
+    trialDataDict['correctAnswer'] = int(trialDesign.correctAnswerTable[
+        version, trialDataDict['contingentCond'], stimIndex])
 
     # determine outcome state considering probability condition
     # if participant made the correct choice
     if trialDataDict['correctAnswer'] == trialDataDict['choice']:
-        # when probability condition is low (0)
-        if trialDataDict['probCond'] == 0:
-            # feedback is chosen with the low probability weighting
-            trialDataDict['isCorrect'] = np.random.choice(
-                2, p=(1 - probConds[0], probConds[0]))
-            if trialDataDict['isCorrect'] == 0:
-                trialDataDict['isForcedError'] = 1
-            elif trialDataDict['isCorrect'] == 1:
-                trialDataDict['isForcedError'] = 0
-        # when probability condition is high (1)
-        elif trialDataDict['probCond'] == 1:
-            # feedback is chosen with the high probabiity weighting
-            trialDataDict['isCorrect'] = np.random.choice(
-                2, p=(1 - probConds[1], probConds[1]))
-            if trialDataDict['isCorrect'] == 0:
-                trialDataDict['isForcedError'] = 1
-            elif trialDataDict['isCorrect'] == 1:
-                trialDataDict['isForcedError'] = 0
+        # when probability condition is low (0) or high (1), the forced error
+        # of this trial was drawn with the schedule
+        if trialDataDict['probCond'] == 0 or trialDataDict['probCond'] == 1:
+            trialDataDict['isForcedError'] = forcedErrorList[trialDataDict['trialTotal']]
+            trialDataDict['isCorrect'] = 1 - trialDataDict['isForcedError']
         else:
             """this is only relevent for practice trials where there is no
             reliability manipulation"""
@@ -657,10 +670,7 @@ def determineFeedback():
     # when participant is not correct determine what type of surprise would be
     # experienced (Bayes or Information theoretic)
     if trialDataDict['isCorrect'] == 0:
-        if stim == stim_BluCir or stim == stim_GreSqr:
-            trialDataDict['surpriseType'] = 0   # InfoTheo Surpries
-        else:
-            trialDataDict['surpriseType'] = 1   # Bayes Surprise
+        trialDataDict['surpriseType'] = int(trialDesign.surpriseTypeTable[stimIndex])
         respSound = soundNotCorrect
     elif trialDataDict['isCorrect'] == 1:
         trialDataDict['points'] += 10
@@ -672,33 +682,35 @@ def fixationScreen(duration=1):
     """Show a fixation screen for a duration of time(s)
     and in the mean time, process what the feedback should be
     """
-    feedbackProcessCheck = False
     trialDataDict['fixStartTime'] = lt.GetLastResult().Timestamp
+    scheduler.start(duration)
     fixStim.draw()
     win0.flip()
-    fixationTimer = core.Clock()
-    while fixationTimer.getTime() < duration:
+    determineFeedback()
+    # flipping waits for the screen refresh, so this does not 'busy wait'
+    while scheduler.running():
         if event.getKeys(keyList=['escape']):
+            scheduler.stop()
             break
-        if feedbackProcessCheck == False:
-            determineFeedback()
-            feedbackProcessCheck = True
-        sleep(0.0000001)   # this sleep command prevents 'busy wait',
-        # consuming less cpu
+        fixStim.draw()
+        win0.flip()
     trialDataDict['fixEndTime'] = lt.GetLastResult().Timestamp
 
 
 def feedbackScreen(duration=4):
     trialDataDict['feedbackStartTime'] = lt.GetLastResult().Timestamp
-    nextFlip = win0.getFutureFlipTime(clock='ptb')
+    nextFlip = scheduler.start(duration)
     respSound.play(when=nextFlip)
-    for frameN in range(duration * refreshRate):
+    frameTimer.reset()
+    while scheduler.running():
         if event.getKeys(keyList=['escape']):
+            scheduler.stop()
             break
         fixStim.draw()
-        win0.flip()
+        frameTimer.record(win0.flip())
     respSound.stop()
     trialDataDict['feedbackEndTime'] = lt.GetLastResult().Timestamp
+    frameTimer.store(trialDataDict, 'feedback')
 
 
 def practiceSection():
@@ -706,18 +718,16 @@ def practiceSection():
     global trialNumbTotal
     global contingentBlockList
     global probabilityConditionList
-    visual.TextStim(win=win0, text=f"{practiceText1}", height=0.9).draw()
+    stimCache['practiceText1'].draw()
     win0.flip()
     keys = event.waitKeys(keyList=['c', 'escape'])
     if keys[-1] == 'c':
         doCalibrate()
     while True:
         if dictInfo['version'] == 0:
-            visual.TextStim(
-                win=win0, text=f"{practiceText2}", height=0.9).draw()
+            stimCache['practiceText2'].draw()
         elif dictInfo['version'] == 1:
-            visual.TextStim(
-                win=win0, text=f"{practiceText2v2}", height=0.9).draw()
+            stimCache['practiceText2v2'].draw()
         win0.flip()
         keys = event.waitKeys(keyList=['escape', 'space'])
         if keys[-1] == 'escape':
@@ -738,7 +748,7 @@ def practiceSection():
                 responseScreen(duration=500)
                 fixationScreen(duration=500)
                 feedbackScreen(duration=500)
-        visual.TextStim(win=win0, text=f"{practiceText3}", height=0.9).draw()
+        stimCache['practiceText3'].draw()
         win0.flip()
         keys = event.waitKeys(keyList=['space', 'r'])
         if keys[-1] == 'space':
@@ -761,63 +771,119 @@ def practiceSection():
                 responseScreen()
                 fixationScreen()
                 feedbackScreen()
-        visual.TextStim(win=win0, text=f"{practiceText4}", height=0.9).draw()
+        stimCache['practiceText4'].draw()
         win0.flip()
         keys = event.waitKeys(keyList=['space', 'r'])
         if keys[-1] == 'space':
             break
 
 
+def saveThread():
+    '''Runs saveTrialData on the backup thread. An exception that stops it is
+    kept in saveErrors, so the trial loop raises it instead of waiting on the
+    full queue forever (see queueTrial).'''
+    try:
+        saveTrialData()
+    except BaseException as error:
+        saveErrors.append(error)
+        raise
+
+
+def checkSaveThread():
+    # raises the exception of the backup thread if it died
+    if saveErrors:
+        raise RuntimeError("saving the trial data failed") from saveErrors[0]
+    if not saveTrialThread.is_alive():
+        raise RuntimeError("the backup thread stopped")
+
+
+def queueTrial(queued):
+    '''Hands a finished trial (or None at the end) to the backup thread.
+    Waits while the queue is full, but raises the exception of the backup
+    thread if it died.'''
+    while True:
+        checkSaveThread()
+        try:
+            saveQueue.put(queued, timeout=saveTimeout)
+            return
+        except Full:
+            pass
+
+
+def waitSaved():
+    '''Waits until the backup thread has saved every queued trial (like
+    saveQueue.join()), so the eye data of the last trial is in eyeQuality.
+    Raises the exception of the backup thread if it died.'''
+    with saveQueue.all_tasks_done:
+        while saveQueue.unfinished_tasks:
+            checkSaveThread()
+            saveQueue.all_tasks_done.wait(saveTimeout)
+
+
 def saveTrialData():
     '''This is a funciton that saves/backs up the trial data.
-    This function is called on a seperate thread and is activated after the
-    feedback screen.
-    It takes the eye tracker data from the feedback period and translates it
-    to a dataframe and adds additional information about the trial then exports
-    it to a CSV file.'''
-    global trialCheck
-
-    dataDir = f"data/{dictInfo['partID']}/pickle/{dictInfo['session#']}"
+    This function is called on a seperate thread and sleeps until the trial
+    loop puts a finished trial on saveQueue. Every trial put on the queue is
+    saved once, in order, and the thread returns when it gets None.
+    It takes the trial data, adds additional information about the participant
+    and writes it as one row of the session's CSV (see trialWriter). The eye
+    tracker samples drained in the background since the last save (see
+    eyeDrain) are appended to the session's eye data recording (see
+    eyeRecorder).'''
+    dataDir = f"data/{dictInfo['partID']}/eyeData/{dictInfo['session#']}"
     try:
-        original_umask = os.umask(0)
-        os.makedirs(dataDir, 0o777)
+        original_umask = umask(0)
+        makedirs(dataDir, 0o777)
     except OSError:
         print("Creation of the directory %s failed" % dataDir)
     else:
         print("Successfully created the directory %s" % dataDir)
     finally:
-        os.umask(original_umask)
-
-    while backupCheck == True:  # this loop stays on throughout the experiment
-        if trialCheck == True:  # this switch is turned on at the end of a trial
-            timer = core.Clock()
-            outDF = pd.DataFrame.from_dict(trialDataDictCopy, orient='index').T
-            outDF.insert(0, 'partID', dictInfo['partID'])
-            outDF.insert(1, 'session', dictInfo['session#'])
-            outDF.insert(2, 'version', dictInfo['version'])
-            outDF['gender'] = dictInfo['gender']
-            outDF['age'] = dictInfo['age']
-            outDF['mascara'] = dictInfo['mascara']
-            outDF['glasses'] = dictInfo['glasses']
-            outDF['contactLens'] = dictInfo['contactLens']
-
-            # saving the dataframe as a CSV
-            if trialDataDictCopy['trialTotal'] == 0:
-                outDF.to_csv(f"data/{dictInfo['partID']}/{dictInfo['partID']}_{dictInfo['session#']}data.csv",
-                             index=False, header=True)
-            else:
-                outDF.to_csv(f"data/{dictInfo['partID']}/{dictInfo['partID']}_{dictInfo['session#']}data.csv",
-                             mode='a', index=False, header=False)
-
-            # pickleing eye tracker data for backup
-            eyeData = lt.GetBufferedEyePositions(fromBeginning=0,
-                                                 removeFromBuffer=1)
-            pickleName = f"{dataDir}/{trialDataDictCopy['trialTotal']}"
-            pickleObject = open(pickleName, 'wb')
-            pickle.dump(eyeData, pickleObject)
-            print(f"{timer.getTime()}\tUPDATED!!")
-            trialCheck = False
-        sleep(0.001)
+        umask(original_umask)
+    recorder = eyeRecorder.EyeRecorder(dataDir)
+    # the schedule of the session, to rerun or check it later
+    with open(f"data/{dictInfo['partID']}/{dictInfo['partID']}_{dictInfo['session#']}schedule.json", 'w') as scheduleFile:
+        json.dump(schedule, scheduleFile)
+    participantInfo = {'partID': dictInfo['partID'],
+                       'session': dictInfo['session#'],
+                       'version': dictInfo['version'],
+                       'scheduleSeed': schedule['seed'],
+                       'gender': dictInfo['gender'],
+                       'age': dictInfo['age'],
+                       'mascara': dictInfo['mascara'],
+                       'glasses': dictInfo['glasses'],
+                       'contactLens': dictInfo['contactLens']}
+    writer = trialWriter.TrialWriter(
+        f"data/{dictInfo['partID']}/{dictInfo['partID']}_{dictInfo['session#']}data.csv",
+        trialColumns, syncEvery=saveSyncEvery, fixedValues=participantInfo)
+
+    lastTrial = None
+    while True:     # this loop stays on throughout the experiment
+        queued = saveQueue.get()   # waits for the end of a trial
+        if queued is None:     # the experiment is over
+            saveQueue.task_done()
+            break
+        finishedTrial, endTime = queued
+        saveStart = perf_counter()
+        # saving the trial as a row of the CSV
+        writer.write(finishedTrial)
+
+        # recording eye tracker data for backup
+        samples = eyeDataDrain.take()
+        recorder.append(finishedTrial['trialTotal'], samples)
+        # rolling quality of the eye data, here instead of in the frame loop
+        eyeQuality.update(samples)
+        saveTimes.append(perf_counter() - saveStart)
+        saveLatencies.append(perf_counter() - endTime)
+        print(f"{saveTimes[-1]}\tUPDATED!!\t{eyeDataDrain.stats()}")
+        lastTrial = finishedTrial['trialTotal']
+        saveQueue.task_done()
+    # samples recorded after the last save belong to the last trial
+    eyeDataDrain.stop()
+    if lastTrial is not None:
+        recorder.append(lastTrial, eyeDataDrain.take())
+    recorder.close()
+    writer.close()
 
 
 # Global Commands
@@ -830,42 +896,14 @@ def versionChange():
     global soundNotCorrect
     global refStimUp
     global refStimDown
-    refSize = 2
-    refPos = 5
     if dictInfo['version'] == 1:
         scaleLabelList.reverse()
         soundList.reverse()
-        refStimUp = visual.Circle(win=win0,
-                                  size=refSize,
-                                  fillColor=blueVal,
-                                  lineColor=(-1, -1, -1),
-                                  edges=99,
-                                  lineWidth=stimLineW,
-                                  pos=(0, refPos)
-                                  )
-        refStimDown = visual.Rect(win=win0,
-                                  size=refSize * 2,
-                                  fillColor=greenVal,
-                                  lineColor=(-1, -1, -1),
-                                  lineWidth=stimLineW,
-                                  pos=(0, -refPos)
-                                  )
+        refStimUp = stimCache[('refStimUp', 1)]
+        refStimDown = stimCache[('refStimDown', 1)]
     else:
-        refStimUp = visual.Rect(win=win0,
-                                size=refSize * 2,
-                                fillColor=greenVal,
-                                lineColor=(-1, -1, -1),
-                                lineWidth=stimLineW,
-                                pos=(0, refPos)
-                                )
-        refStimDown = visual.Circle(win=win0,
-                                    size=refSize,
-                                    fillColor=blueVal,
-                                    lineColor=(-1, -1, -1),
-                                    edges=99,
-                                    lineWidth=stimLineW,
-                                    pos=(0, -refPos)
-                                    )
+        refStimUp = stimCache[('refStimUp', 0)]
+        refStimDown = stimCache[('refStimDown', 0)]
     soundCorrect = sound.Sound(value=soundList[0], stereo=-1,
                                hamming=True, preBuffer=-1)
     soundNotCorrect = sound.Sound(value=soundList[-1], stereo=-1,
@@ -885,9 +923,18 @@ if __name__ == '__main__':
                                  'blueEyes', 'debug'])
     if dlg.OK == False:	# if user pressed cancel
         win0.close()
-	core.quit()    
+        core.quit()
     debugging()
+    # a pregenerated schedule sets the counterbalanced version of the
+    # participant, whatever version was typed in the dialog
+    schedule = scheduleStore.loadSchedule(scheduleDB, dictInfo['partID'],
+                                          dictInfo['session#'])
+    if schedule is not None and schedule['version'] != dictInfo['version']:
+        print(f"version {dictInfo['version']} changed to {schedule['version']}, "
+              f"the version of the stored schedule")
+        dictInfo['version'] = schedule['version']
     versionChange()
+    stimCache.warmUp()
     lt.Init()   # initialize LiveTrack (Eye tracker)
     lt.StartTracking()  # LiveTrack start tracking
     win0.flip()
@@ -899,18 +946,18 @@ if __name__ == '__main__':
         practiceSection()
     # Experimental Trials Section Start
     if doExp == True:
-        visual.TextStim(win0, text=f"{expText1}").draw()
+        stimCache['expText1'].draw()
         win0.flip()
         keys = event.waitKeys(keyList=['c', 'escape'])
         if keys[-1] == 'c':
             doCalibrate()
-        visual.TextStim(win0, text=f"{expText2}").draw()
+        stimCache['expText2'].draw()
         win0.flip()
         keys = event.waitKeys(keyList=['space'])
         win0.flip()
 
         # reset eye tracker buffer and dictionaries before exp trials
-        trialDataDict = dict.fromkeys(trialDataKeys)
+        trialDataDict = TrialRecord()
         trialDataDict['points'] = 0
         trialDataDict['trialTotal'] = -1
         lt.StopTracking()
@@ -918,22 +965,36 @@ if __name__ == '__main__':
         lt.SetResultsTypeCalibrated()
         lt.StartTracking()
 
-	# initialize lists of trial, blocks parameters
-        blockTrialNumbs = randIntListSetTotal(12, 16, 10, 22, 3)
-        contingentBlockList = makeContingentBlockList(blockTrialNumbs)
-        probabilityConditionList = makeProbabilityConditionList(
-            blockTrialNumbs)
-        stimSequence = randIntNoRepeat(sum(blockTrialNumbs), 0, 3)
+        # initialize lists of trial, blocks parameters from the session's
+        # pregenerated schedule, or from a new seed when there is none
+        if schedule is None:
+            schedule = scheduleStore.makeSchedule(random.getrandbits(32),
+                                                  dictInfo['version'])
+            scheduleStore.saveSchedule(scheduleDB, dictInfo['partID'],
+                                       dictInfo['session#'], schedule)
+        print(f"schedule seed: {schedule['seed']}")
+        blockTrialNumbs = schedule['blockTrialNumbs']
+        contingentBlockList = schedule['contingentBlockList']
+        probabilityConditionList = schedule['probabilityConditionList']
+        stimSequence = schedule['stimSequence']
+        forcedErrorList = schedule['forcedErrorList']
 
 	# initialize thread for saving trial / eyetracker data
         if doSave == True:	
-            saveTrialThread = Thread(target=saveTrialData)
+            eyeDataDrain = eyeDrain.EyeDrain(lt)
+            eyeQuality = qualityMonitor.QualityMonitor(lt.GetCaptureConfig()[2],
+                                                       lt.GetTracking())
+            eyeDataDrain.start()
+            saveTrialThread = Thread(target=saveThread)
             saveTrialThread.start()
 
 	# start of actual eperimental trials
         for blockNumb in range(len(blockTrialNumbs)):
             if blockNumb == len(blockTrialNumbs) / 2:
                 breakSection()
+            elif blockNumb > 0 and doSave == True:
+                waitSaved()
+                qualityCheck()
             for trialNumb in range(blockTrialNumbs[blockNumb]):
                 while True:
                     trialDataDict['blockTrial'] = trialNumb
@@ -949,38 +1010,43 @@ if __name__ == '__main__':
                     win0.mouseVisible = False
                     if trialDataDict['respSuccess'] == 0:
                         noRespScreen()
-                        trialDataDictCopy = deepcopy(trialDataDict)
-                        trialCheck = True
+                        if doSave == True:
+                            queueTrial((trialDataDict.snapshot(), perf_counter()))
                         break
                     fixationScreen(duration=0.985)
                     feedbackScreen()
-                    trialDataDictCopy = deepcopy(trialDataDict)
-                    trialCheck = True
+                    if doSave == True:
+                        queueTrial((trialDataDict.snapshot(), perf_counter()))
                     break
 
 	# end of experiment texts
         if trialDataDict['points'] != 0:
             pointsPercent = round(
                 ((trialDataDict['points'] / ((trialDataDict['trialTotal'] + 1) * 10)) * 100) + 0.5)
-            visual.TextStim(win=win0, text=f"""You have finished the session!\n
+            stimCache.text('endText', f"""You have finished the session!\n
                         You have earned {trialDataDict['points']} gold out of {(trialDataDict['trialTotal'] + 1)*10}!\n
                         That is {pointsPercent}%!\n
-                        Thank you for your participation.\n\nSaving...""", height=0.9).draw()
+                        Thank you for your participation.\n\nSaving...""").draw()
             win0.flip()
-            sleep(3)
-            backupCheck = False
 
-	    # stopping saving thread
-            if doSave == True:
-                saveTrialThread.join()
+        # stopping saving thread, it returns once every queued trial is saved
+        if doSave == True:
+            queueTrial(None)
+            saveTrialThread.join()
 
-            visual.TextStim(win=win0, text=f""""You have finished the session!\n
+        if trialDataDict['points'] != 0:
+            stimCache.text('endText', f""""You have finished the session!\n
                         You have earned {trialDataDict['points']} gold out of {(trialDataDict['trialTotal'] + 1)*10}!\n
                         That is {pointsPercent}%!\n
                         Thank you for your participation.\n\nSaving done!\n
-                        Press [Space] to end.""", height=0.9).draw()
+                        Press [Space] to end.""").draw()
             win0.flip()
     event.waitKeys(keyList=('space'))
     lt.StopTracking()
     lt.Close()
     win0.close()
+    if headlessRun and doExp == True:
+        headless.report(f"data/{dictInfo['partID']}", dictInfo['version'],
+                        trialDataDict['trialTotal'] + 1,
+                        saveTimes, saveLatencies,
+                        eyeDataDrain.stats() if doSave == True else None)
@@ -0,0 +1,115 @@
+"""
+Typed columnar storage of the converted eye data.
+
+Every trial is written to its own parquet file, partitioned by participant,
+session and trial:
+    {rootDir}/partID=000/session=0/trialTotal=12/eyeData.parquet
+The columns are the LiveTrack structure fields (the same ones getdict gives)
+with the dtypes of the structure, so later stages can read only the columns
+and the time windows they need instead of parsing the whole CSV.
+"""
+
+import os
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# columns kept by the pupil preprocessing
+pupilColumns = ['Timestamp', 'PupilMajorAxis', 'PupilMajorAxisRight',
+                'Tracked', 'TrackedRight', 'GazeX', 'GazeY', 'GazeXRight',
+                'GazeYRight']
+
+partitionSchema = pa.schema([('partID', pa.string()),
+                             ('session', pa.int32()),
+                             ('trialTotal', pa.int32())])
+
+fileName = 'eyeData.parquet'
+
+
+def trialDir(rootDir, partID, session, trialTotal):
+    # this function returns the partition directory of a trial
+    return os.path.join(rootDir, f"partID={partID}", f"session={session}",
+                        f"trialTotal={trialTotal}")
+
+
+def writeTrial(outDF, rootDir, partID, session, trialTotal, rowGroupSize=65536):
+    """Writes the eye data dataframe of one trial to its partition.
+    An existing file for the same trial is replaced.
+    Input: dataframe from eyeData2Frame (typed) or mpFunc(..., typed=True)
+           root directory of the store
+           participant ID, session number and trial number
+           number of samples per row group (the unit of predicate pushdown)
+    Output: path of the written file
+    """
+    outDir = trialDir(rootDir, partID, session, trialTotal)
+    os.makedirs(outDir, exist_ok=True)
+    outPath = os.path.join(outDir, fileName)
+    table = pa.Table.from_pandas(outDF, preserve_index=False)
+    # write next to the target first so a crash never leaves half a file
+    tempPath = os.path.join(outDir, '_' + fileName)
+    pq.write_table(table, tempPath, row_group_size=rowGroupSize)
+    os.replace(tempPath, outPath)
+    return outPath
+
+
+def trialKey(path):
+    # this function returns the (partID, session, trialTotal) of a trial file
+    parts = dict(part.split('=', 1) for part in path.split(os.sep) if '=' in part)
+    return parts['partID'], int(parts['session']), int(parts['trialTotal'])
+
+
+def openStore(rootDir):
+    """Returns the whole store as a pyarrow dataset.
+    Files are listed in participant, session and trial order so that reads
+    come back in recording order.
+    """
+    paths = []
+    for dirPath, _, fileNames in os.walk(rootDir):
+        if fileName in fileNames:
+            paths.append(os.path.join(dirPath, fileName))
+    paths.sort(key=lambda path: trialKey(os.path.relpath(path, rootDir)))
+    return ds.dataset(paths, format='parquet', partition_base_dir=rootDir,
+                      partitioning=ds.partitioning(partitionSchema, flavor='hive'))
+
+
+def makeFilter(partID=None, session=None, trials=None, timeRange=None):
+    """Returns a pyarrow filter expression (or None for no filtering).
+    Conditions on partID/session/trialTotal prune whole files and the
+    Timestamp range is checked against the row group statistics, so data
+    outside of it is never decoded.
+    Input: participant ID, session number
+           list of trial numbers or (first, last) tuple
+           (start, end) tuple of Timestamp values, both ends included
+    """
+    conditions = []
+    if partID is not None:
+        conditions.append(ds.field('partID') == str(partID))
+    if session is not None:
+        conditions.append(ds.field('session') == int(session))
+    if isinstance(trials, tuple):
+        conditions.append((ds.field('trialTotal') >= trials[0]) &
+                          (ds.field('trialTotal') <= trials[1]))
+    elif trials is not None:
+        conditions.append(ds.field('trialTotal').isin(list(trials)))
+    if timeRange is not None:
+        conditions.append((ds.field('Timestamp') >= timeRange[0]) &
+                          (ds.field('Timestamp') <= timeRange[1]))
+    if len(conditions) == 0:
+        return None
+    outFilter = conditions[0]
+    for condition in conditions[1:]:
+        outFilter = outFilter & condition
+    return outFilter
+
+
+def readEyeData(rootDir, columns=None, partID=None, session=None, trials=None,
+                timeRange=None):
+    """Returns the requested part of the eye data store as a dataframe.
+    Only the listed columns are read (all columns when None), partition
+    columns (partID, session, trialTotal) can be listed like any other.
+    See makeFilter for the other arguments.
+    """
+    store = openStore(rootDir)
+    table = store.to_table(columns=columns,
+                           filter=makeFilter(partID, session, trials, timeRange))
+    return table.to_pandas()
@@ -0,0 +1,110 @@
+"""
+Background draining of the LiveTrack sample buffer.
+
+Instead of pulling the whole trial's samples out of the tracker in one burst
+after every trial, a dedicated thread pulls GetBufferedEyePositions every few
+milliseconds into a queue. The save thread takes whatever was drained so far,
+so the tracker buffer never holds more than one interval of samples and the
+per-trial save work stays small. The queue is a collections.deque, whose
+append and popleft are atomic, so the frame loop and the save thread never
+wait on a lock for it.
+"""
+
+import time
+from collections import deque
+from threading import Event, Lock, Thread
+
+
+class EyeDrain(Thread):
+    """Thread that drains the tracker buffer at a fixed interval.
+    Input: LiveTrack module (or a stand-in with GetBufferedEyePositions)
+           interval between drains in seconds
+    Statistics (all times in seconds):
+        lastLatency/maxLatency: delay from the scheduled drain time until the
+            samples of that drain were queued
+        highWater: most samples pulled out of the tracker in one drain, i.e.
+            the largest the tracker buffer got
+        queueHighWater: most samples waiting in the queue to be saved
+    """
+
+    def __init__(self, device, interval=0.02):
+        Thread.__init__(self, daemon=True)
+        self.device = device
+        self.interval = interval
+        self.batches = deque()
+        # each counter has a single writer thread, so no lock is needed
+        self.drained = 0
+        self.taken = 0
+        self.stopEvent = Event()
+        # held while draining, so pause() returns only between drains
+        self.drainLock = Lock()
+        self.paused = False
+        self.nDrains = 0
+        self.lastLatency = 0.0
+        self.maxLatency = 0.0
+        self.totalLatency = 0.0
+        self.highWater = 0
+        self.queueHighWater = 0
+
+    def drain(self):
+        # pull all buffered samples out of the tracker into the queue
+        samples = self.device.GetBufferedEyePositions(fromBeginning=0,
+                                                      removeFromBuffer=1)
+        if len(samples) > 0:
+            self.batches.append(samples)
+            self.drained += len(samples)
+            self.highWater = max(self.highWater, len(samples))
+            self.queueHighWater = max(self.queueHighWater,
+                                      self.drained - self.taken)
+        self.nDrains += 1
+
+    def run(self):
+        deadline = time.perf_counter()
+        while True:
+            # deadlines are kept on a fixed grid so the interval does not drift
+            deadline += self.interval
+            if self.stopEvent.wait(max(deadline - time.perf_counter(), 0)):
+                break
+            with self.drainLock:
+                if not self.paused:
+                    self.drain()
+            latency = time.perf_counter() - deadline
+            self.lastLatency = latency
+            self.maxLatency = max(self.maxLatency, latency)
+            self.totalLatency += latency
+            if latency > self.interval:
+                # fell behind (e.g. system stall), restart the grid from now
+                deadline = time.perf_counter()
+        self.drain()    # samples left after the last interval
+
+    def take(self):
+        """Returns all samples drained so far as one list, oldest first."""
+        samples = []
+        while self.batches:
+            batch = self.batches.popleft()
+            self.taken += len(batch)
+            samples.extend(batch)
+        return samples
+
+    def pause(self):
+        # stop draining until resume (e.g. while calibrate reads the buffer)
+        with self.drainLock:
+            self.paused = True
+
+    def resume(self):
+        self.paused = False
+
+    def stop(self):
+        # stop draining, the samples left in the tracker are drained once more
+        self.stopEvent.set()
+        self.join()
+
+    def stats(self):
+        # this function returns the drain statistics as a dictionary
+        return {'nDrains': self.nDrains,
+                'nSamples': self.drained,
+                'lastLatency': self.lastLatency,
+                'maxLatency': self.maxLatency,
+                'meanLatency': self.totalLatency / max(self.nDrains, 1),
+                'highWater': self.highWater,
+                'queueHighWater': self.queueHighWater}
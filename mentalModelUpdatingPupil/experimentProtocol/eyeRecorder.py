@@ -0,0 +1,154 @@
+"""
+Binary recorder for the LiveTrack eye data of a session.
+
+Instead of one pickle per trial, the raw sample structures of every trial are
+appended to one preallocated, memory-mapped file:
+    {dataDir}/eyeData.bin     raw structures, back to back
+    {dataDir}/eyeLayout.json  numpy layout of one structure (from _fields_)
+    {dataDir}/eyeIndex.bin    one (trialTotal, start, nSamples) record per trial
+Saving a trial is a single copy of its samples into the mapped file plus one
+small index record. Offline tools map the file straight into a numpy
+structured array with loadSession, nothing has to be unpickled.
+"""
+
+import ctypes
+import json
+import mmap
+import os
+import numpy as np
+
+indexDtype = np.dtype([('trialTotal', '<i8'), ('start', '<i8'), ('nSamples', '<i8')])
+
+dataName = 'eyeData.bin'
+layoutName = 'eyeLayout.json'
+indexName = 'eyeIndex.bin'
+
+
+def sampleBytes(eyeData):
+    # this function returns the raw bytes of a list (or ctypes array) of samples
+    if isinstance(eyeData, ctypes.Array):
+        return memoryview(eyeData).cast('B')
+    return b''.join(map(bytes, eyeData))
+
+
+def samplesArray(eyeData):
+    """Returns the samples as one numpy structured array.
+    The dtype follows the _fields_ layout of the ctypes structure, so every
+    sample is read from memory once instead of field by field. A ctypes
+    array is viewed without copying.
+    Input: list (or ctypes array) of LiveTrack eye data structures
+    Output: structured array with one record per sample
+    """
+    return np.frombuffer(sampleBytes(eyeData), dtype=np.dtype(type(eyeData[0])))
+
+
+class EyeRecorder:
+    """Appends the eye data of every trial to one memory-mapped session file.
+    The file is preallocated for `capacity` samples (about 3 hours at 500Hz
+    by default) and grows by the same amount if a session ever exceeds it.
+    An existing recording in dataDir is continued, e.g. after a restart.
+    """
+
+    def __init__(self, dataDir, capacity=500 * 60 * 60 * 3):
+        self.dataPath = os.path.join(dataDir, dataName)
+        self.layoutPath = os.path.join(dataDir, layoutName)
+        self.indexPath = os.path.join(dataDir, indexName)
+        self.growBy = capacity
+        self.itemSize = None
+        self.dataFile = None
+        self.dataMap = None
+        self.nSamples = 0
+        if os.path.exists(self.indexPath) and os.path.exists(self.layoutPath):
+            index = np.fromfile(self.indexPath, dtype=indexDtype)
+            if len(index) > 0:
+                self.nSamples = int(index['start'][-1] + index['nSamples'][-1])
+            self.itemSize = layoutDtype(self.layoutPath).itemsize
+            self.mapFile(max(self.nSamples, 1))
+        self.indexFile = open(self.indexPath, 'ab')
+
+    def mapFile(self, minSamples):
+        # (re)map the data file with room for at least minSamples samples
+        if self.dataMap is not None:
+            self.dataMap.flush()
+            self.dataMap.close()
+        if self.dataFile is None:
+            mode = 'r+b' if os.path.exists(self.dataPath) else 'w+b'
+            self.dataFile = open(self.dataPath, mode)
+        size = os.path.getsize(self.dataPath)
+        if size < minSamples * self.itemSize:
+            size = (minSamples + self.growBy) * self.itemSize
+            self.dataFile.truncate(size)
+        self.dataMap = mmap.mmap(self.dataFile.fileno(), size)
+
+    def start(self, sampleType):
+        # write the layout of the sample structure and preallocate the file
+        dtype = np.dtype(sampleType)
+        layout = {'names': list(dtype.names),
+                  'formats': [dtype.fields[name][0].str for name in dtype.names],
+                  'offsets': [dtype.fields[name][1] for name in dtype.names],
+                  'itemsize': dtype.itemsize}
+        with open(self.layoutPath, 'w') as layoutFile:
+            json.dump(layout, layoutFile, indent=1)
+        self.itemSize = dtype.itemsize
+        self.mapFile(1)
+
+    def append(self, trialTotal, eyeData):
+        """Copies the samples of a trial to the end of the session file.
+        Input: trial number
+               list (or ctypes array) of LiveTrack eye data structures
+        """
+        nSamples = len(eyeData)
+        if nSamples > 0:
+            if self.itemSize is None:
+                self.start(type(eyeData[0]))
+            start = self.nSamples * self.itemSize
+            end = start + nSamples * self.itemSize
+            if end > len(self.dataMap):
+                self.mapFile(self.nSamples + nSamples)
+            self.dataMap[start:end] = sampleBytes(eyeData)
+        record = np.array([(trialTotal, self.nSamples, nSamples)], dtype=indexDtype)
+        self.indexFile.write(record.tobytes())
+        self.indexFile.flush()
+        self.nSamples += nSamples
+
+    def close(self):
+        # flush the samples and cut the file down to what was recorded
+        self.indexFile.close()
+        if self.dataMap is not None:
+            self.dataMap.flush()
+            self.dataMap.close()
+            self.dataMap = None
+            self.dataFile.truncate(self.nSamples * self.itemSize)
+            self.dataFile.close()
+            self.dataFile = None
+
+
+def layoutDtype(layoutPath):
+    # this function returns the numpy dtype saved by EyeRecorder.start
+    with open(layoutPath) as layoutFile:
+        return np.dtype(json.load(layoutFile))
+
+
+def loadSession(dataDir):
+    """Maps a recorded session into numpy without copying it.
+    Input: directory given to EyeRecorder
+    Output: read-only structured array of all samples (memmap),
+            array of (trialTotal, start, nSamples) trial records
+    """
+    index = np.fromfile(os.path.join(dataDir, indexName), dtype=indexDtype)
+    layoutPath = os.path.join(dataDir, layoutName)
+    nSamples = int(index['start'][-1] + index['nSamples'][-1]) if len(index) else 0
+    if nSamples == 0:
+        return np.zeros(0), index
+    samples = np.memmap(os.path.join(dataDir, dataName), dtype=layoutDtype(layoutPath),
+                        mode='r', shape=(nSamples,))
+    return samples, index
+
+
+def trialSamples(samples, index, trialTotal):
+    # this function returns the samples of one trial of a loaded session
+    # (a trial can have several consecutive records)
+    records = index[index['trialTotal'] == trialTotal]
+    if len(records) == 0:
+        return samples[:0]
+    return samples[records['start'].min():(records['start'] + records['nSamples']).max()]
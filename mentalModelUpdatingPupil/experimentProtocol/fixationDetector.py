@@ -0,0 +1,117 @@
+"""
+Incremental fixation detection for the calibration.
+
+calibrate.py used to read the last fixDurSamples samples out of the tracker
+buffer over and over, as fast as the CPU allowed, and for every read split
+them into ten lists and took their max/min. Here each new sample is taken
+out of the buffer once, converted in one go and pushed into fixed size ring
+arrays per eye. The range of the pupil-glint vector over the window comes
+from monotonic queues and the untracked samples from a running count, so
+every sample costs O(1) (amortized) and a check costs O(1). The medians are
+only taken once, from the ring arrays, when a fixation is accepted.
+"""
+
+from collections import deque
+import numpy as np
+from eyeRecorder import samplesArray
+
+
+class SlidingRange:
+    """Minimum and maximum of the last n values pushed.
+    Each queue keeps (index, value) of the values that can still become the
+    maximum (minimum) of a later window, in order, so the front is the
+    answer and every value is added and removed once.
+    """
+
+    def __init__(self, n):
+        self.n = n
+        self.i = 0
+        self.maxQueue = deque()
+        self.minQueue = deque()
+
+    def push(self, value):
+        while self.maxQueue and self.maxQueue[-1][1] <= value:
+            self.maxQueue.pop()
+        self.maxQueue.append((self.i, value))
+        while self.minQueue and self.minQueue[-1][1] >= value:
+            self.minQueue.pop()
+        self.minQueue.append((self.i, value))
+        # drop the values that left the window
+        if self.maxQueue[0][0] <= self.i - self.n:
+            self.maxQueue.popleft()
+        if self.minQueue[0][0] <= self.i - self.n:
+            self.minQueue.popleft()
+        self.i += 1
+
+    def range(self):
+        return self.maxQueue[0][1] - self.minQueue[0][1]
+
+
+class EyeWindow:
+    """The last n samples of one eye.
+    Input: number of samples in the window
+           suffix of the eye's LiveTrack fields ('' left, 'Right' right)
+    """
+    fields = ['VectX', 'VectY', 'GlintX', 'GlintY']
+
+    def __init__(self, n, suffix=''):
+        self.n = n
+        self.suffix = suffix
+        self.ring = np.zeros((len(self.fields), n))
+        self.tracked = np.zeros(n, dtype=bool)
+        self.nSamples = 0
+        self.nUntracked = 0     # untracked samples in the window
+        self.rangeX = SlidingRange(n)
+        self.rangeY = SlidingRange(n)
+
+    def push(self, samples):
+        # add a structured array of new samples to the window
+        values = np.stack([samples[field + self.suffix] for field in self.fields])
+        tracked = samples['Tracked' + self.suffix].astype(bool)
+        for j in range(len(samples)):
+            slot = self.nSamples % self.n
+            if self.nSamples >= self.n:
+                self.nUntracked -= not self.tracked[slot]
+            self.ring[:, slot] = values[:, j]
+            self.tracked[slot] = tracked[j]
+            self.nUntracked += not tracked[j]
+            self.rangeX.push(values[0, j])
+            self.rangeY.push(values[1, j])
+            self.nSamples += 1
+
+    def isFixation(self, threshold):
+        """True when the window is full, every sample in it is tracked and
+        the pupil-glint vector moved at most threshold in x and y."""
+        return (self.nSamples >= self.n and self.nUntracked == 0 and
+                max(self.rangeX.range(), self.rangeY.range()) <= threshold)
+
+    def medians(self):
+        # this function returns the median VectX, VectY, GlintX, GlintY
+        return np.median(self.ring, axis=1)
+
+
+class FixationDetector:
+    """Fixation windows of both eyes, fed from the tracker buffer.
+    Input: number of samples a fixation lasts
+           largest movement of the pupil-glint vector in a fixation
+           (camera pixels)
+    """
+
+    def __init__(self, nSamples, threshold):
+        self.threshold = threshold
+        self.left = EyeWindow(nSamples, '')
+        self.right = EyeWindow(nSamples, 'Right')
+
+    def update(self, data):
+        # push a batch of samples (list of LiveTrack structures) to both eyes
+        if len(data) > 0:
+            samples = samplesArray(data)
+            self.left.push(samples)
+            self.right.push(samples)
+
+    def isFixation(self, eye):
+        # eye: 0 == left, 1 == right
+        return (self.left, self.right)[eye].isFixation(self.threshold)
+
+    def medians(self, eye):
+        return (self.left, self.right)[eye].medians()
@@ -0,0 +1,137 @@
+"""
+Local gaze calibration models, fitted on the calibration targets.
+
+calibrate.py hands the medians of the pupil-glint vector (VectX/VectY) at
+every target to LiveTrack.CalibrateDevice, and the gaze model it fits only
+lives on the device. Here the same points are fitted locally per eye with a
+least squares polynomial of the vector (second order: 1, x, y, xy, x^2, y^2,
+the usual pupil-corneal reflection model, or first order when there are
+fewer than 6 targets), and the calibration points and models are saved with
+the session. mapGaze evaluates a model on whole arrays, so the gaze of a
+recorded session can be recomputed from the raw vectors of the exported eye
+data (see recalibrate) without the tracker.
+"""
+
+import json
+import os
+import numpy as np
+
+eyes = {'left': '', 'right': 'Right'}  # eye -> suffix of its LiveTrack fields
+
+
+def designMatrix(vectX, vectY, order):
+    # this function returns the polynomial terms of the vectors, one column
+    # per term
+    vectX = np.asarray(vectX, dtype=np.float64)
+    vectY = np.asarray(vectY, dtype=np.float64)
+    terms = [np.ones_like(vectX), vectX, vectY]
+    if order == 2:
+        terms += [vectX * vectY, vectX * vectX, vectY * vectY]
+    return np.stack(terms, axis=-1)
+
+
+def fitGazeModel(targetX, targetY, vectX, vectY, order=2):
+    """Fits the gaze model of one eye.
+    Input: target locations in screen pixels, median pupil-glint vectors at
+           the targets, order of the polynomial (1 or 2)
+    Output: dictionary of the order, coefficients of x and y, number of
+            targets and the error (pixels, root mean square over the targets)
+    """
+    nPoints = len(targetX)
+    if nPoints < 3:
+        raise ValueError(f"{nPoints} targets are too few to fit a gaze model")
+    if order == 2 and nPoints < 6:
+        order = 1
+    design = designMatrix(vectX, vectY, order)
+    targets = np.column_stack([targetX, targetY]).astype(np.float64)
+    coef = np.linalg.lstsq(design, targets, rcond=None)[0]
+    residuals = design @ coef - targets
+    return {'order': order,
+            'coefX': coef[:, 0].tolist(),
+            'coefY': coef[:, 1].tolist(),
+            'nPoints': nPoints,
+            'rmsError': float(np.sqrt(np.mean(np.sum(residuals ** 2, axis=1))))}
+
+
+def mapGaze(model, vectX, vectY):
+    """Returns the gaze (screen pixels) of pupil-glint vectors.
+    Input: model from fitGazeModel, arrays of VectX and VectY
+    Output: arrays of gaze x and y (NaN where a vector is NaN)
+    """
+    x = np.asarray(vectX, dtype=np.float64)
+    y = np.asarray(vectY, dtype=np.float64)
+    gaze = []
+    for coef in (model['coefX'], model['coefY']):
+        # the terms are summed one at a time instead of building the design
+        # matrix, so a session takes a few arrays of memory
+        values = coef[0] + coef[1] * x + coef[2] * y
+        if model['order'] == 2:
+            values += coef[3] * x * y + coef[4] * x * x + coef[5] * y * y
+        gaze.append(values)
+    return gaze[0], gaze[1]
+
+
+def leaveOneOutError(targetX, targetY, vectX, vectY, order=2):
+    """Validates a calibration on its own targets: every target is predicted
+    by the model fitted on the other targets.
+    Output: error per target in pixels
+    """
+    targetX, targetY = np.asarray(targetX), np.asarray(targetY)
+    vectX, vectY = np.asarray(vectX), np.asarray(vectY)
+    errors = []
+    for k in range(len(targetX)):
+        keep = np.arange(len(targetX)) != k
+        model = fitGazeModel(targetX[keep], targetY[keep], vectX[keep], vectY[keep], order)
+        gazeX, gazeY = mapGaze(model, vectX[k], vectY[k])
+        errors.append(float(np.hypot(gazeX - targetX[k], gazeY - targetY[k])))
+    return errors
+
+
+def fitCalibration(points, order=2):
+    """Fits the models of every eye in a set of calibration points.
+    Input: dictionary of eye ('left'/'right') -> dictionary of the lists
+           targetX, targetY, VectX, VectY of the targets with a fixation
+    Output: dictionary of eye -> model (eyes with too few targets are left out)
+    """
+    models = {}
+    for eye, eyePoints in points.items():
+        if len(eyePoints['targetX']) >= 3:
+            models[eye] = fitGazeModel(eyePoints['targetX'], eyePoints['targetY'],
+                                       eyePoints['VectX'], eyePoints['VectY'], order)
+    return models
+
+
+def saveCalibration(path, calibration):
+    # writes a calibration (points, models and screen settings) as JSON
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as calibrationFile:
+        json.dump(calibration, calibrationFile)
+
+
+def loadCalibration(path):
+    with open(path) as calibrationFile:
+        return json.load(calibrationFile)
+
+
+def recalibrate(eyeDF, models):
+    """Returns the eye data with the gaze recomputed by the local models.
+    Input: dataframe with VectX, VectY (and VectXRight, VectYRight) and
+           Tracked (TrackedRight) columns, e.g.
+           eyeDataStore.readEyeData(rootDir, columns=[...])
+           models per eye, e.g. loadCalibration(path)['models'] or
+           fitCalibration of other points
+    Output: copy of eyeDF with GazeXFit, GazeYFit (and GazeXRightFit,
+            GazeYRightFit), NaN where the eye is not tracked
+    """
+    outDF = eyeDF.copy()
+    for eye, model in models.items():
+        suffix = eyes[eye]
+        gazeX, gazeY = mapGaze(model, eyeDF['VectX' + suffix].to_numpy(dtype=np.float64),
+                               eyeDF['VectY' + suffix].to_numpy(dtype=np.float64))
+        untracked = eyeDF['Tracked' + suffix].to_numpy() == 0
+        gazeX[untracked] = np.nan
+        gazeY[untracked] = np.nan
+        outDF['GazeX' + suffix + 'Fit'] = gazeX
+        outDF['GazeY' + suffix + 'Fit'] = gazeY
+    return outDF
@@ -0,0 +1,269 @@
+"""
+Headless run of the protocol with a simulated participant.
+
+    python expProtocol.py --headless --partID sim000 --session 0 --version 0
+
+runs a whole session without a display, eye tracker or participant:
+    - simLiveTrack stands in for the LiveTrack module
+    - visual, core, event, gui and sound stand in for the psychopy modules
+      the protocol uses. Stimuli are not drawn, and every win.flip() moves a
+      simulated clock on by one frame instead of waiting for the screen, so
+      the session runs as fast as the protocol code allows.
+    - a SimParticipant answers the response screen (choice after a random
+      response time, then a rating) and misses some trials
+Everything else (scheduling, trial records, the save thread, the eye data
+drain and recorder) is the protocol's own code, so a headless session writes
+the same files as a real one. At the end report() prints one JSON line with
+the throughput of the session (see simSessions to run many of them).
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+import types
+import numpy as np
+import simLiveTrack
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--headless', action='store_true')
+parser.add_argument('--partID', default='sim000')
+parser.add_argument('--session', default='0')
+parser.add_argument('--version', type=int, default=0)
+parser.add_argument('--debug', default='3', help="as in dictInfo, default "
+                    "'3' runs only the experimental trials")
+parser.add_argument('--seed', type=int, default=None)
+parser.add_argument('--refreshRate', type=float, default=60.0)
+parser.add_argument('--noRespRate', type=float, default=0.02,
+                    help="share of trials the participant does not answer")
+options, _ = parser.parse_known_args()
+
+wallStart = time.perf_counter()
+
+
+class SimClock:
+    # simulated time in seconds, moved on by the window and the participant
+    def __init__(self):
+        self.t = 0.0
+
+    def getTime(self):
+        return self.t
+
+    def advance(self, dt):
+        self.t += dt
+
+
+simClock = SimClock()
+rng = np.random.default_rng(options.seed)
+simLiveTrack.setClock(simClock.getTime, options.seed)
+
+
+class SimParticipant:
+    """Answers the response screen.
+    The choice (up or down, at random) is clicked after a log-normal response
+    time and the rating follows after a second one. A share of the trials
+    (noRespRate) gets no answer at all.
+    """
+
+    def __init__(self, noRespRate):
+        self.noRespRate = noRespRate
+        self.choiceTime = math.inf
+        self.ratingTime = math.inf
+        self.choice = None
+        self.rating = None
+        self.clicked = False
+
+    def startResponse(self):
+        # called when the response screen makes its mouse
+        if rng.random() < self.noRespRate:
+            self.choiceTime = math.inf
+        else:
+            self.choiceTime = simClock.t + rng.lognormal(math.log(1.0), 0.35)
+        self.ratingTime = self.choiceTime + rng.lognormal(math.log(0.8), 0.35)
+        self.choice = int(rng.integers(2))     # 1 == up, 0 == down
+        self.rating = float(rng.uniform(0, 20))
+        self.clicked = False
+
+    def isPressedIn(self, button):
+        # one click on the chosen button (up buttons are above the centre)
+        if self.clicked or simClock.t < self.choiceTime:
+            return False
+        if (button.pos[1] > 0) == (self.choice == 1):
+            self.clicked = True
+            return True
+        return False
+
+    def getRating(self):
+        return self.rating if simClock.t >= self.ratingTime else None
+
+    def getHistory(self):
+        if simClock.t < self.ratingTime:
+            return []
+        return [(self.rating, self.ratingTime - self.choiceTime)]
+
+
+participant = SimParticipant(options.noRespRate)
+
+
+# psychopy.visual
+class Window:
+    def __init__(self, *args, **kwargs):
+        self.frameDur = 1.0 / options.refreshRate
+        self.mouseVisible = True
+
+    def getActualFrameRate(self):
+        return options.refreshRate
+
+    def getFutureFlipTime(self, clock=None):
+        return simClock.t + self.frameDur
+
+    def flip(self):
+        simClock.advance(self.frameDur)
+        return simClock.t
+
+    def clearBuffer(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class Stim:
+    # any stimulus, keeps the arguments the protocol reads back
+    def __init__(self, win=None, text=None, pos=(0, 0), **kwargs):
+        self.win = win
+        self.text = text
+        self.pos = pos
+
+    def draw(self):
+        pass
+
+
+class Slider(Stim):
+    def getRating(self):
+        return participant.getRating()
+
+    def getHistory(self):
+        return participant.getHistory()
+
+    def reset(self):
+        pass
+
+
+visual = types.SimpleNamespace(Window=Window, Circle=Stim, Rect=Stim,
+                               ImageStim=Stim, TextStim=Stim, Slider=Slider)
+
+
+# psychopy.core
+class Clock:
+    def __init__(self):
+        self.start = simClock.t
+
+    def getTime(self):
+        return simClock.t - self.start
+
+    def reset(self):
+        self.start = simClock.t
+
+
+def quit():
+    sys.exit(0)
+
+
+core = types.SimpleNamespace(Clock=Clock, quit=quit, wait=simClock.advance)
+
+
+# psychopy.event
+class Mouse:
+    def __init__(self, win=None, newPos=None, **kwargs):
+        participant.startResponse()
+
+    def isPressedIn(self, stim):
+        return participant.isPressedIn(stim)
+
+
+class GlobalKeys:
+    def add(self, **kwargs):
+        pass
+
+
+def getKeys(keyList=None, **kwargs):
+    return []
+
+
+def waitKeys(keyList=None, **kwargs):
+    # reads the screen for a moment, then continues ([space]) or skips the
+    # calibration ([escape] when there is no [space])
+    simClock.advance(2.0)
+    if keyList is None or 'space' in keyList:
+        return ['space']
+    return ['escape']
+
+
+event = types.SimpleNamespace(Mouse=Mouse, globalKeys=GlobalKeys(),
+                              getKeys=getKeys, waitKeys=waitKeys)
+
+
+# psychopy.sound
+class Sound:
+    def __init__(self, value=None, **kwargs):
+        self.value = value
+
+    def play(self, when=None):
+        pass
+
+    def stop(self):
+        pass
+
+
+sound = types.SimpleNamespace(Sound=Sound)
+
+
+# psychopy.gui
+class DlgFromDict:
+    # fills the participant information from the command line
+    def __init__(self, dictionary, **kwargs):
+        dictionary['partID'] = options.partID
+        dictionary['session#'] = options.session
+        dictionary['version'] = options.version
+        dictionary['debug'] = options.debug
+        self.OK = True
+
+
+gui = types.SimpleNamespace(DlgFromDict=DlgFromDict)
+
+
+def dirSize(path):
+    # this function returns the total size of the files under path in bytes
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(path) for name in names)
+
+
+def report(dataDir, version, nTrials, saveTimes, saveLatencies, drainStats):
+    """Prints the summary of a headless session as one JSON line.
+    Input: data directory of the participant
+           version of the session (the stored schedule's, see scheduleStore)
+           number of trials run
+           wall time each trial took to save (s)
+           wall time from the end of each trial until it was saved (s)
+           eyeDrain statistics
+    """
+    wallTime = time.perf_counter() - wallStart
+    summary = {'partID': options.partID,
+               'session': options.session,
+               'version': version,
+               'seed': options.seed,
+               'trials': nTrials,
+               'simTime': simClock.t,
+               'wallTime': wallTime,
+               'speedUp': simClock.t / wallTime,
+               'trialsPerSec': nTrials / wallTime,
+               'saveTimeMean': float(np.mean(saveTimes)) if saveTimes else None,
+               'saveTimeMax': float(np.max(saveTimes)) if saveTimes else None,
+               'latencyMean': float(np.mean(saveLatencies)) if saveLatencies else None,
+               'latencyMax': float(np.max(saveLatencies)) if saveLatencies else None,
+               'bytesWritten': dirSize(dataDir),
+               'drain': drainStats}
+    print(json.dumps(summary))
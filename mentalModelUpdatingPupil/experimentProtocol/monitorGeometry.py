@@ -0,0 +1,129 @@
+"""
+Exact conversion between screen pixels and degrees of visual angle.
+
+calibrate.py converted with misc.pix2deg/misc.deg2pix and a pixPerDeg from
+tan(1 degree) * viewing distance, i.e. the same number of pixels for every
+degree. On a flat screen a degree covers more pixels towards the edges, so
+positions converted that way are off at the edges (by 1.5% at 12 degrees).
+Here the visual angle of every pixel position along each axis of a monitor
+profile (screen size, resolution, viewing distance) is computed once with
+the exact arctangent and cached on disk, and whole arrays of positions are
+converted by looking them up in those tables. The angles are per axis, like
+psychopy's 'degFlatPos' units: x degrees = atan(x mm / viewing distance),
+and the same for y. Positions are in pixels from the centre of the screen
+(psychopy 'pix' units, and the LiveTrack gaze after calibration).
+"""
+
+import os
+import numpy as np
+
+cacheDir = os.path.join('data', 'geometry')
+
+
+def axisTable(nPix, pixSize, viewDist):
+    # this function returns the whole pixel positions of an axis from edge to
+    # edge (origin at the centre) and their visual angle in degrees
+    half = int(np.ceil(nPix / 2))
+    pix = np.arange(-half, half + 1, dtype=np.float64)
+    return pix, np.degrees(np.arctan(pix * pixSize / viewDist))
+
+
+class MonitorGeometry:
+    """Pixel <-> degree transforms of one monitor profile.
+    Input: screen size [width, height] in mm
+           screen resolution [width, height] in pixels
+           viewing distance in mm
+           directory of the cached tables (None to not cache them)
+    Positions between two table entries are interpolated linearly, which is
+    within 1e-5 degrees of the exact angle down to a viewing distance of
+    300mm. Positions off the screen are computed exactly.
+    """
+
+    def __init__(self, screenSize, screenRes, viewDist, cacheDir=cacheDir):
+        self.screenSize = [float(size) for size in screenSize]
+        self.screenRes = [int(res) for res in screenRes]
+        self.viewDist = float(viewDist)
+        self.pixSize = [self.screenSize[axis] / self.screenRes[axis] for axis in (0, 1)]
+        # pixels per degree at the centre of the screen (where it is largest)
+        self.pixPerDeg = [np.radians(1.0) * self.viewDist / pixSize
+                          for pixSize in self.pixSize]
+        self.tables = self.loadTables(cacheDir)
+
+    def cachePath(self, cacheDir):
+        return os.path.join(cacheDir, "{:g}x{:g}mm_{}x{}px_{:g}mm.npz".format(
+            *self.screenSize, *self.screenRes, self.viewDist))
+
+    def loadTables(self, cacheDir):
+        # this function returns [(pixels, degrees) of x, (pixels, degrees) of y]
+        # from the cache, computed (and cached) if they are not there yet
+        path = None if cacheDir is None else self.cachePath(cacheDir)
+        if path is not None and os.path.exists(path):
+            with np.load(path) as cached:
+                return [(cached['pixX'], cached['degX']), (cached['pixY'], cached['degY'])]
+        tables = [axisTable(self.screenRes[axis], self.pixSize[axis], self.viewDist)
+                  for axis in (0, 1)]
+        if path is not None:
+            os.makedirs(cacheDir, exist_ok=True)
+            # write next to it and rename, so a half written file is never read
+            with open(path + '.tmp', 'wb') as cacheFile:
+                np.savez(cacheFile, pixX=tables[0][0], degX=tables[0][1],
+                         pixY=tables[1][0], degY=tables[1][1])
+            os.replace(path + '.tmp', path)
+        return tables
+
+    def pix2deg(self, pix, axis=0):
+        """Returns the visual angle of positions along one axis.
+        Input: positions in pixels (number or array), axis (0 == x, 1 == y)
+        Output: positions in degrees (NaN stays NaN)
+        """
+        pix = np.asarray(pix, dtype=np.float64)
+        pixTable, degTable = self.tables[axis]
+        deg = np.interp(pix, pixTable, degTable)
+        off = (pix < pixTable[0]) | (pix > pixTable[-1])
+        if off.any():
+            deg = np.where(off, np.degrees(np.arctan(pix * self.pixSize[axis] / self.viewDist)),
+                           deg)
+        return deg
+
+    def deg2pix(self, deg, axis=0):
+        """Returns the pixel position of visual angles along one axis.
+        Input: positions in degrees (number or array), axis (0 == x, 1 == y)
+        Output: positions in pixels (NaN stays NaN)
+        """
+        deg = np.asarray(deg, dtype=np.float64)
+        pixTable, degTable = self.tables[axis]
+        pix = np.interp(deg, degTable, pixTable)
+        off = (deg < degTable[0]) | (deg > degTable[-1])
+        if off.any():
+            pix = np.where(off, np.tan(np.radians(deg)) * self.viewDist / self.pixSize[axis],
+                           pix)
+        return pix
+
+    def posPix2Deg(self, pos):
+        # positions [[x, y], ...] in pixels to degrees
+        pos = np.asarray(pos, dtype=np.float64)
+        return np.stack([self.pix2deg(pos[..., 0], 0), self.pix2deg(pos[..., 1], 1)], axis=-1)
+
+    def posDeg2Pix(self, pos):
+        # positions [[x, y], ...] in degrees to pixels
+        pos = np.asarray(pos, dtype=np.float64)
+        return np.stack([self.deg2pix(pos[..., 0], 0), self.deg2pix(pos[..., 1], 1)], axis=-1)
+
+    def sizeDeg2Pix(self, size, axis=0):
+        # size in pixels of something size degrees across at the centre
+        return 2 * self.deg2pix(np.asarray(size, dtype=np.float64) / 2, axis)
+
+
+def gazeToDeg(eyeDF, geometry):
+    """Returns the eye data with the gaze of both eyes in degrees.
+    Input: dataframe with GazeX, GazeY, GazeXRight and GazeYRight columns in
+           pixels from the centre of the screen, e.g.
+           eyeDataStore.readEyeData(rootDir, columns=eyeDataStore.pupilColumns)
+           MonitorGeometry of the screen the session was recorded on
+    Output: copy of eyeDF with the columns GazeXDeg, GazeYDeg, GazeXRightDeg
+            and GazeYRightDeg
+    """
+    outDF = eyeDF.copy()
+    for column, axis in [('GazeX', 0), ('GazeY', 1), ('GazeXRight', 0), ('GazeYRight', 1)]:
+        outDF[column + 'Deg'] = geometry.pix2deg(eyeDF[column].to_numpy(dtype=np.float64), axis)
+    return outDF
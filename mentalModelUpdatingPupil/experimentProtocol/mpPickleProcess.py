@@ -1,10 +1,14 @@
+import ctypes
+import hashlib
+import json
+import numpy as np
 import pandas as pd
 import  pickle
 import os
-import timeit
-from multiprocessing import Pool, cpu_count
-from psychopy import core
+from collections import deque
+from multiprocessing import Pool, cpu_count, shared_memory
 from tqdm import tqdm
+import eyeRecorder
 
 def getdict(struct):
     # this function returns a dictionary of the cython data structure (eye data)
@@ -16,29 +20,317 @@ def eyeData2DF(numb):
     outDF = pd.DataFrame.from_dict(dict1, orient='index').T
     return outDF
 
-def mpFunc(numb):
-    global outDF
-    p = Pool(cpu_count()-1)
-    results = p.map(eyeData2DF, numb)
+def fieldKind(ctype):
+    # this function returns the kind of value ctypes gives back for a field
+    # 'b' == bool, 'f' == float, 'i' == integer, 'o' == anything else
+    if issubclass(ctype, ctypes.c_bool):
+        return 'b'
+    if issubclass(ctype, (ctypes.c_float, ctypes.c_double, ctypes.c_longdouble)):
+        return 'f'
+    if getattr(ctype, '_type_', None) in tuple('bBhHiIlLqQ'):
+        return 'i'
+    return 'o'
 
-    p.close()
-    p.join()
+def fieldKinds(data):
+    # this function returns (field, kind) pairs for the structures in data
+    return [(field, fieldKind(ctype)) for field, ctype in type(data[0])._fields_]
 
-    outDF = outDF.append(results)
+def objectColumns(data, kinds):
+    # this function returns the values of the non numeric fields, which are
+    # kept as the python objects ctypes gives back
+    return dict((field, [getattr(struct, field) for struct in data])
+                for field, kind in kinds if kind == 'o')
+
+def samples2Frame(samples, kinds, others, typed=False):
+    """Returns a dataframe built from a structured array of eye data samples.
+    This gives the same columns, dtypes and therefore the same CSV output as
+    appending one eyeData2DF row per sample, but each column is filled at once.
+    Input: structured array from eyeRecorder.samplesArray,
+           (field, kind) pairs from fieldKinds
+           dictionary of non numeric columns from objectColumns
+           typed: keep the dtypes of the structure fields instead
+    Output: dataframe with one row per sample
+    """
+    if typed:
+        columns = dict((field, others[field] if kind == 'o' else samples[field])
+                       for field, kind in kinds)
+        return pd.DataFrame(columns)
+    kindSet = set(kind for _, kind in kinds)
+    # eyeData2DF rows get a single dtype inferred by pandas: object when there
+    # is a non numeric field (each value kept as is), otherwise float when
+    # there is a float field (integers get upcast), otherwise integer
+    if 'b' in kindSet or 'o' in kindSet:
+        dtypes = {'b': bool, 'f': np.float64, 'i': np.int64}
+    elif 'f' in kindSet:
+        dtypes = dict.fromkeys('fi', np.float64)
+    else:
+        dtypes = {'i': np.int64}
+    columns = {}
+    for field, kind in kinds:
+        if kind == 'o':
+            columns[field] = others[field]
+        else:
+            columns[field] = samples[field].astype(dtypes[kind])
+    return pd.DataFrame(columns)
+
+def eyeData2Frame(data):
+    """Returns a dataframe of all the eye data samples of a trial.
+    """
+    if len(data) == 0:
+        return pd.DataFrame()
+    kinds = fieldKinds(data)
+    return samples2Frame(eyeRecorder.samplesArray(data), kinds, objectColumns(data, kinds))
+
+def convertTrialFile(task):
+    """Converts one pickled trial into a shared memory slot (pool worker).
+    Only the slot name, dtype and sample count are sent back to the main
+    process, the samples themselves never go through pickle.
+    Input: (path of the trial pickle, name of a free slot)
+    Output: (slot name, dtype, number of samples, field kinds, non numeric
+             columns, samples that did not fit the slot or None)
+    """
+    filePath, slotName = task
+    with open(filePath, 'rb') as pickleObject:
+        data = pickle.load(pickleObject)
+    if len(data) == 0:
+        return slotName, None, 0, [], {}, None
+    samples = eyeRecorder.samplesArray(data)
+    kinds = fieldKinds(data)
+    others = objectColumns(data, kinds)
+    slot = shared_memory.SharedMemory(name=slotName)
+    if samples.nbytes > slot.size:
+        # should not happen since pickles are larger than their raw samples,
+        # send this trial back the slow way
+        slot.close()
+        return slotName, samples.dtype, len(samples), kinds, others, samples
+    slotView = np.ndarray(len(samples), dtype=samples.dtype, buffer=slot.buf)
+    slotView[:] = samples
+    del slotView
+    slot.close()
+    return slotName, samples.dtype, len(samples), kinds, others, None
+
+def mpFunc(filePaths, processes=None, typed=False):
+    """Converts trial pickles with one pool that lives for the whole run.
+    Each worker takes a whole trial file and writes its samples into one of a
+    fixed set of shared memory slots. A trial is only submitted once the main
+    process has a free slot for it, which bounds how far the workers can run
+    ahead. An error in a worker (e.g. a corrupt pickle) is raised here, and
+    an error in the caller stops the pool, instead of either hanging.
+    Input: list of paths of trial pickles
+           number of worker processes (default: one less than the cpu count)
+           typed: keep the dtypes of the structure fields (see samples2Frame)
+    Output: generator of (file path, dataframe) in the order of filePaths
+    """
+    if processes is None:
+        processes = max(cpu_count() - 1, 1)
+    if len(filePaths) == 0:
+        return
+    # a pickled trial is always larger than its raw samples
+    slotSize = max(max(os.path.getsize(filePath) for filePath in filePaths), 1)
+    slots = {}
+    freeSlots = []
+    try:
+        for i in range(processes * 2):
+            slot = shared_memory.SharedMemory(create=True, size=slotSize)
+            slots[slot.name] = slot
+            freeSlots.append(slot.name)
+        with Pool(processes) as p:
+            running = deque()   # (file path, result) of the submitted trials, in order
+            nextFile = 0
+            while running or nextFile < len(filePaths):
+                # every free slot goes to the next trial
+                while freeSlots and nextFile < len(filePaths):
+                    task = (filePaths[nextFile], freeSlots.pop())
+                    running.append((filePaths[nextFile],
+                                    p.apply_async(convertTrialFile, (task,))))
+                    nextFile += 1
+                filePath, result = running.popleft()
+                # raises the exception of the worker, if any
+                slotName, dtype, nSamples, kinds, others, samples = result.get()
+                if nSamples == 0:
+                    outDF = pd.DataFrame()
+                else:
+                    if samples is None:
+                        samples = np.ndarray(nSamples, dtype=dtype,
+                                             buffer=slots[slotName].buf).copy()
+                    outDF = samples2Frame(samples, kinds, others, typed)
+                freeSlots.append(slotName)
+                yield filePath, outDF
+    finally:
+        for slot in slots.values():
+            slot.close()
+            slot.unlink()
+
+def fileHash(filePath):
+    # this function returns the sha1 hash of the content of a file
+    sha = hashlib.sha1()
+    with open(filePath, 'rb') as fileObject:
+        for chunk in iter(lambda: fileObject.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def pickleState(filePath, oldEntry=None):
+    """Returns the size, modification time and content hash of a trial pickle.
+    The hash is only recomputed when the size or modification time differ
+    from the manifest entry of the last run.
+    """
+    stat = os.stat(filePath)
+    if (oldEntry is not None and oldEntry['size'] == stat.st_size
+            and oldEntry['mtime'] == stat.st_mtime_ns):
+        digest = oldEntry['hash']
+    else:
+        digest = fileHash(filePath)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'hash': digest}
+
+def dtypeKinds(dtype):
+    # this function returns (field, kind) pairs of a structured dtype, the
+    # same as fieldKinds gives for the structure it was made from
+    kinds = {'b': 'b', 'f': 'f', 'i': 'i', 'u': 'i'}
+    return [(field, kinds.get(dtype.fields[field][0].kind, 'o')) for field in dtype.names]
+
+def recordedTrials(dirPath):
+    """Returns the trials of a session recorded with eyeRecorder.
+    Output: dictionary of trial name -> structured array of its samples
+            (memory-mapped), in the order they were recorded
+    """
+    samples, index = eyeRecorder.loadSession(dirPath)
+    return dict((str(trialTotal), eyeRecorder.trialSamples(samples, index, trialTotal))
+                for trialTotal in dict.fromkeys(index['trialTotal'].tolist()))
+
+def samplesState(samples):
+    # this function returns the manifest entry of a recorded trial, the hash
+    # is over its raw samples
+    return {'size': samples.nbytes, 'mtime': None,
+            'hash': hashlib.sha1(np.ascontiguousarray(samples).tobytes()).hexdigest()}
+
+def recordedFrame(samples, typed=False):
+    # this function returns the dataframe of a recorded trial (see samples2Frame)
+    if len(samples) == 0:
+        return pd.DataFrame()
+    return samples2Frame(np.asarray(samples), dtypeKinds(samples.dtype), {}, typed)
+
+def loadManifest(manifestPath, outputMode):
+    # this function returns the manifest of the last run (empty if none)
+    if os.path.exists(manifestPath):
+        with open(manifestPath) as manifestObject:
+            manifest = json.load(manifestObject)
+        if manifest['outputMode'] == outputMode:
+            return manifest
+    return {'outputMode': outputMode, 'trials': {}}
+
+def saveManifest(manifest, manifestPath):
+    # write next to the manifest first so a crash never leaves half a file
+    tempPath = manifestPath + '.tmp'
+    with open(tempPath, 'w') as manifestObject:
+        json.dump(manifest, manifestObject, indent=1)
+    os.replace(tempPath, manifestPath)
+
+def convertSession(dirPath, outPath, outputMode='csv', partID=None, session=None,
+                   processes=None):
+    """Converts the trials of a session, resuming where the last run stopped.
+    A manifest records every finished trial with the hash of its pickle and,
+    for CSV output, the byte range it occupies in the CSV. On the next run
+    the CSV is cut back to the last trial that is still valid (unchanged
+    pickle, complete bytes, no earlier trial added) and only the trials after
+    it are converted. Parquet trials are independent files, so any unchanged
+    trial is skipped. The CSV header is written with the first trial that
+    has samples, whatever its number.
+    Input: directory of trial pickles (named by trial number), or of a
+           session recorded with eyeRecorder (converted in this process)
+           CSV path or root directory of the parquet store (see eyeDataStore)
+           'csv' or 'parquet'
+           participant ID and session number (parquet only)
+           number of worker processes (see mpFunc)
+    Output: list of trial names that were converted in this run
+    """
+    recorded = os.path.exists(os.path.join(dirPath, eyeRecorder.indexName))
+    if recorded:
+        trials = recordedTrials(dirPath)
+        fileList = list(trials)
+    else:
+        fileList = os.listdir(dirPath)
+        fileList.sort(key=int)
+    if outputMode == 'csv':
+        manifestPath = outPath + '.manifest.json'
+    else:
+        import eyeDataStore
+        sessionDir = os.path.dirname(eyeDataStore.trialDir(outPath, partID, session, 0))
+        os.makedirs(sessionDir, exist_ok=True)
+        manifestPath = os.path.join(sessionDir, 'manifest.json')
+    manifest = loadManifest(manifestPath, outputMode)
+    oldTrials = manifest['trials']
+    if recorded:
+        states = dict((fileName, samplesState(trials[fileName])) for fileName in fileList)
+    else:
+        states = dict((fileName, pickleState(os.path.join(dirPath, fileName),
+                                             oldTrials.get(fileName)))
+                      for fileName in fileList)
+
+    if outputMode == 'csv':
+        # keep the longest run of leading trials that are still valid
+        csvSize = os.path.getsize(outPath) if os.path.exists(outPath) else 0
+        offset = 0
+        keep = 0
+        for fileName in fileList:
+            entry = oldTrials.get(fileName)
+            if (entry is None or entry['hash'] != states[fileName]['hash']
+                    or entry['start'] != offset or entry['end'] > csvSize):
+                break
+            offset = entry['end']
+            keep += 1
+        manifest['trials'] = dict((fileName, oldTrials[fileName])
+                                  for fileName in fileList[:keep])
+        pending = fileList[keep:]
+        with open(outPath, 'ab') as csvObject:
+            csvObject.truncate(offset)
+    else:
+        manifest['trials'] = {}
+        pending = []
+        for fileName in fileList:
+            entry = oldTrials.get(fileName)
+            if (entry is not None and entry['hash'] == states[fileName]['hash']
+                    and (entry['path'] is None or os.path.exists(entry['path']))):
+                manifest['trials'][fileName] = entry
+            else:
+                pending.append(fileName)
+    saveManifest(manifest, manifestPath)
+
+    typed = outputMode != 'csv'
+    if recorded:
+        converted = ((fileName, recordedFrame(trials[fileName], typed))
+                     for fileName in pending)
+    else:
+        filePaths = [os.path.join(dirPath, fileName) for fileName in pending]
+        converted = ((os.path.basename(filePath), outDF)
+                     for filePath, outDF in mpFunc(filePaths, processes, typed))
+    for fileName, outDF in tqdm(converted, total=len(pending)):
+        entry = dict(states[fileName])
+        if outputMode == 'csv':
+            entry['start'] = offset
+            if len(outDF) > 0:
+                with open(outPath, 'a', newline='') as csvObject:
+                    outDF.to_csv(csvObject, index=False, header=offset == 0)
+                    csvObject.flush()
+                    os.fsync(csvObject.fileno())
+                offset = os.path.getsize(outPath)
+            entry['end'] = offset
+        else:
+            entry['path'] = None
+            if len(outDF) > 0:
+                entry['path'] = eyeDataStore.writeTrial(outDF, outPath, partID,
+                                                        session, int(fileName))
+        manifest['trials'][fileName] = entry
+        saveManifest(manifest, manifestPath)
+    return pending
 
 if __name__=='__main__':
+    outputMode = 'csv'  # 'csv' or 'parquet'
+    partID = '000'
+    session = 0
     dirPath = 'data/eyeData'
-    fileList=os.listdir(dirPath)
-    fileList.sort(key=int)
-    timer = core.Clock()
-    outDF = pd.DataFrame()
     csvName = 'test114.csv'
-    for fileName in tqdm(fileList):
-        data = pickle.load(open(f"pickles/{fileName}",'rb'))
-        numb = range(len(data))
-        mpFunc(numb)
-        if fileName == '0':
-            outDF.to_csv(csvName, index=False, header=True)
-        else:
-            outDF.to_csv(csvName, index=False, header=False, mode='a')
-        outDF = pd.DataFrame()
\ No newline at end of file
+    parquetDir = 'data/eyeDataParquet'
+    if outputMode == 'csv':
+        convertSession(dirPath, csvName)
+    else:
+        convertSession(dirPath, parquetDir, outputMode, partID, session)
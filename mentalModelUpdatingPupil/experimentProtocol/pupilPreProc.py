@@ -0,0 +1,82 @@
+"""
+Pupil preprocessing of the converted eye data.
+
+A port of the pupil steps in supplament/02-pupilPreProc.Rmd: label blinks
+and non-tracked samples, extend the blinks, remove the pupil samples during
+blinks, interpolate them linearly and low-pass filter the whole series.
+Every step works on whole arrays, so a session of ~600k samples takes a
+fraction of a second instead of the per-index extendBlinks loop.
+"""
+
+import numpy as np
+from scipy import signal
+
+
+def labelBlinks(tracked, trackedRight):
+    # this function returns True for samples where either eye is not tracked
+    return (np.asarray(tracked) == 0) | (np.asarray(trackedRight) == 0)
+
+
+def extendBlinks(isBlink, dur=50):
+    """Returns the blink labels extended by dur samples before and after every
+    blink (50 samples is 100ms at 500Hz), clipped to the ends of the data.
+    Works on the blink runs instead of on every blink sample.
+    Input: boolean array of blink labels
+           number of samples to extend on each side
+    Output: boolean array of extended blink labels
+    """
+    isBlink = np.asarray(isBlink, dtype=bool)
+    n = len(isBlink)
+    edges = np.diff(np.concatenate(([0], isBlink.view(np.int8), [0])))
+    onsets = np.flatnonzero(edges == 1)
+    offsets = np.flatnonzero(edges == -1)     # one past the last blink sample
+    # mark the extended runs with +1 at their start and -1 past their end
+    delta = np.zeros(n + 1, dtype=np.int64)
+    np.add.at(delta, np.maximum(onsets - dur, 0), 1)
+    np.add.at(delta, np.minimum(offsets + dur, n), -1)
+    return np.cumsum(delta[:n]) > 0
+
+
+def interpolateGaps(values):
+    """Returns values with NaN samples linearly interpolated from the nearest
+    valid samples, and the first/last valid value extended to the ends
+    (imputeTS::na_interpolation followed by zoo::na.fill "extend").
+    """
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    if valid.all() or not valid.any():
+        return values.copy()
+    index = np.arange(len(values))
+    return np.interp(index, index[valid], values[valid])
+
+
+def lowPassFilter(values, order=4, cutoff=0.04):
+    """Returns values passed through a low-pass Butterworth filter.
+    Same as signal::filter(signal::butter(order, cutoff, type="low"), values)
+    in R: a single forward pass, cutoff relative to the Nyquist frequency.
+    """
+    b, a = signal.butter(order, cutoff, btype='low')
+    return signal.lfilter(b, a, values)
+
+
+def preprocessPupil(eyeDF, dur=50, order=4, cutoff=0.04):
+    """Returns the eye data with blink labels and the preprocessed pupil size.
+    Input: dataframe with Tracked, TrackedRight, PupilMajorAxis and
+           PupilMajorAxisRight columns, e.g.
+           eyeDataStore.readEyeData(rootDir, columns=eyeDataStore.pupilColumns)
+           blink extension in samples (see extendBlinks)
+           filter order and cutoff (see lowPassFilter)
+    Output: copy of eyeDF with the columns isBlink (0/1) and pupilAvg
+    """
+    outDF = eyeDF.copy()
+    isBlink = extendBlinks(labelBlinks(eyeDF['Tracked'].to_numpy(),
+                                       eyeDF['TrackedRight'].to_numpy()), dur)
+    pupilAvg = (eyeDF['PupilMajorAxis'].to_numpy(dtype=np.float64) +
+                eyeDF['PupilMajorAxisRight'].to_numpy(dtype=np.float64)) / 2
+    pupilAvg[isBlink] = np.nan
+    pupilAvg = interpolateGaps(pupilAvg)
+    if not np.isnan(pupilAvg).any():
+        pupilAvg = lowPassFilter(pupilAvg, order, cutoff)
+    outDF['isBlink'] = isBlink.astype(np.int8)
+    outDF['pupilAvg'] = pupilAvg
+    return outDF
@@ -0,0 +1,131 @@
+"""
+Rolling quality of the eye data during the session.
+
+Tracking gets worse over a session (mascara, glasses, blue eyes, the
+participant slumping on the chin-rest), and the samples were only looked at
+after the session. A QualityMonitor is fed the samples the save thread takes
+from the EyeDrain after every trial, so nothing runs in the frame loop. Per
+eye it keeps, for each block of blockSize samples of the last nBlocks, the
+number of samples, tracked samples, blink onsets and the sum and sum of
+squares of the tracked pupil size. That is a fixed array however long the
+session is, and every batch of samples is added with a few numpy sums per
+block. Between blocks of trials the protocol asks problems() whether the
+last minute or so was poor enough to recalibrate.
+"""
+
+import numpy as np
+from eyeRecorder import samplesArray
+
+
+class RollingEyeStats:
+    """Rolling statistics of one eye over the last nBlocks * blockSize samples
+    (the oldest block is dropped once the newest one is started).
+    Input: suffix of the eye's LiveTrack fields ('' left, 'Right' right)
+           samples per block, number of blocks
+    """
+    # columns of blocks
+    columns = ['nSamples', 'nTracked', 'nBlinks', 'pupilSum', 'pupilSumSq']
+
+    def __init__(self, suffix, blockSize, nBlocks):
+        self.suffix = suffix
+        self.blockSize = blockSize
+        self.blocks = np.zeros((nBlocks, len(self.columns)))
+        self.nSamples = 0
+        self.lastTracked = True
+
+    def push(self, samples):
+        # add a structured array of new samples
+        tracked = samples['Tracked' + self.suffix].astype(bool)
+        if len(tracked) == 0:
+            return
+        previous = np.concatenate(([self.lastTracked], tracked[:-1]))
+        self.lastTracked = tracked[-1]
+        pupil = np.where(tracked, samples['PupilMajorAxis' + self.suffix], 0.0)
+        values = np.column_stack([np.ones(len(tracked)), tracked, previous & ~tracked,
+                                  pupil, pupil * pupil])
+        start = 0
+        while start < len(values):
+            # fill the current block up to its end, then start the next
+            offset = self.nSamples % self.blockSize
+            row = (self.nSamples // self.blockSize) % len(self.blocks)
+            if offset == 0:
+                self.blocks[row] = 0
+            end = min(start + self.blockSize - offset, len(values))
+            self.blocks[row] += values[start:end].sum(axis=0)
+            self.nSamples += end - start
+            start = end
+
+    def stats(self, sampleRate):
+        """Returns the statistics of the window as a dictionary:
+        seconds of data, ratio of tracked samples, blinks per minute, and mean
+        and standard deviation of the tracked pupil size (None without data)
+        """
+        nSamples, nTracked, nBlinks, pupilSum, pupilSumSq = self.blocks.sum(axis=0).tolist()
+        if nSamples == 0:
+            return {'seconds': 0.0, 'trackedRatio': None, 'blinkRate': None,
+                    'pupilMean': None, 'pupilSD': None}
+        pupilMean = pupilSum / nTracked if nTracked > 0 else None
+        pupilSD = (float(np.sqrt(max(pupilSumSq / nTracked - pupilMean ** 2, 0.0)))
+                   if nTracked > 0 else None)
+        return {'seconds': nSamples / sampleRate,
+                'trackedRatio': nTracked / nSamples,
+                'blinkRate': nBlinks / (nSamples / sampleRate / 60),
+                'pupilMean': pupilMean,
+                'pupilSD': pupilSD}
+
+    def reset(self):
+        self.blocks[:] = 0
+        self.nSamples = 0
+        self.lastTracked = True
+
+
+class QualityMonitor:
+    """Rolling eye data quality of both eyes.
+    Input: sample rate of the tracker (Hz)
+           [trackLeftEye, trackRightEye] (LiveTrack.GetTracking())
+           length of the window in seconds (kept in 1 second blocks)
+           lowest ratio of tracked samples and most blinks per minute before
+           recalibrating is suggested
+    """
+
+    def __init__(self, sampleRate=500, tracking=(True, True), window=60,
+                 minTracked=0.8, maxBlinkRate=40):
+        self.sampleRate = sampleRate
+        self.minTracked = minTracked
+        self.maxBlinkRate = maxBlinkRate
+        blockSize = max(int(round(sampleRate)), 1)
+        self.eyes = {}
+        if tracking[0]:
+            self.eyes['left'] = RollingEyeStats('', blockSize, window)
+        if tracking[1]:
+            self.eyes['right'] = RollingEyeStats('Right', blockSize, window)
+
+    def update(self, data):
+        # add a batch of samples (list of LiveTrack structures), e.g. EyeDrain.take()
+        if len(data) > 0:
+            samples = samplesArray(data)
+            for eye in self.eyes.values():
+                eye.push(samples)
+
+    def stats(self):
+        # this function returns the statistics of every tracked eye
+        return {name: eye.stats(self.sampleRate) for name, eye in self.eyes.items()}
+
+    def problems(self):
+        """Returns a list of the reasons to recalibrate (empty if none)."""
+        problems = []
+        for name, stats in self.stats().items():
+            if stats['trackedRatio'] is None:
+                continue
+            if stats['trackedRatio'] < self.minTracked:
+                problems.append(f"{name} eye tracked in {stats['trackedRatio']:.0%} "
+                                f"of the last {stats['seconds']:.0f}s")
+            if stats['blinkRate'] > self.maxBlinkRate:
+                problems.append(f"{name} eye lost {stats['blinkRate']:.0f} times per minute "
+                                f"in the last {stats['seconds']:.0f}s")
+        return problems
+
+    def reset(self):
+        # forget the window, e.g. after a recalibration
+        for eye in self.eyes.values():
+            eye.reset()
@@ -0,0 +1,105 @@
+"""
+Labelling of eye samples with the trial they belong to.
+
+Every sample gets the trial, section and condition columns of the trial row
+(written by saveTrialData) that it falls in, using the same boundaries as
+supplament/02-pupilPreProc.Rmd. Instead of scanning all samples for every
+trial row, the section boundaries are sorted once and each sample is looked
+up with searchsorted, which is O(n log k) for n samples and k trials.
+Timestamps of both tables must already be corrected (see
+timestampCorrection), i.e. increase over the session.
+"""
+
+import numpy as np
+
+# section starts in the order they happen in a trial
+# 0 == points, 1 == stim, 2 == resp, 3 == fix, 4 == feedback
+sectionColumns = ['pointsStartTime', 'stimStartTime', 'respStartTime',
+                  'fixStartTime', 'feedbackStartTime']
+
+# end of the last trial, the first one that is not missing
+lastEndColumns = ['feedbackEndTime', 'noRespEndTime']
+
+# trial columns copied onto the samples
+labelColumns = ['trialTotal', 'block', 'isCorrect', 'surpriseType',
+                'contingentCond', 'probCond']
+
+
+def sectionIntervals(summDF):
+    """Returns the section intervals of all trials, sorted by start.
+    Section k runs from its start time to the start time of section k+1 and
+    the feedback section ends at feedbackEndTime. Sections with a missing
+    boundary (e.g. fix/feedback of no response trials) are left out.
+    Output: arrays of start times, end times, trial row index and section
+    """
+    bounds = summDF[sectionColumns + ['feedbackEndTime']].to_numpy(dtype=np.float64)
+    starts = bounds[:, :-1].ravel()
+    ends = bounds[:, 1:].ravel()
+    rows = np.repeat(np.arange(len(summDF)), len(sectionColumns))
+    sections = np.tile(np.arange(len(sectionColumns)), len(summDF))
+    keep = ~(np.isnan(starts) | np.isnan(ends))
+    order = np.argsort(starts[keep], kind='stable')
+    return (starts[keep][order], ends[keep][order], rows[keep][order],
+            sections[keep][order])
+
+
+def trialRows(timestamps, summDF):
+    """Returns the trial row index of every sample (-1 for none).
+    A trial runs from its pointsStartTime up to the next trial's
+    pointsStartTime, the last trial up to its feedbackEndTime, or its
+    noRespEndTime when it had no response. Without either, the samples after
+    the start of the last trial are not labelled.
+    """
+    pointsStart = summDF['pointsStartTime'].to_numpy(dtype=np.float64)
+    order = np.argsort(pointsStart, kind='stable')
+    rows = np.searchsorted(pointsStart[order], timestamps, side='right') - 1
+    outRows = np.where(rows >= 0, order[np.maximum(rows, 0)], -1)
+    last = order[-1]
+    lastEnd = np.nan
+    for column in lastEndColumns:
+        if column in summDF.columns and np.isnan(lastEnd):
+            lastEnd = float(summDF[column].iloc[last])
+    # a comparison with NaN is False, so compare the other way round
+    afterLast = (rows == len(order) - 1) & ~(timestamps <= lastEnd)
+    outRows[afterLast] = -1
+    return outRows
+
+
+def labelSamples(eyeDF, summDF, columns=None, dropUnlabelled=False):
+    """Returns the eye data labelled with trial, section and trial columns.
+    Samples that fall on the boundary of two sections get the later section.
+    Input: eye data with a (corrected) Timestamp column
+           trial summary of the same session (one row per trial)
+           trial columns to copy onto the samples (default: labelColumns
+           present in summDF)
+           drop samples outside of any section (as the R preprocessing does)
+    Output: copy of eyeDF with the trial columns and section (-1 for none);
+            trial columns are NaN for samples outside of any trial
+    """
+    if columns is None:
+        columns = [column for column in labelColumns if column in summDF.columns]
+    timestamps = eyeDF['Timestamp'].to_numpy(dtype=np.float64)
+    summDF = summDF.reset_index(drop=True)
+    outDF = eyeDF.copy()
+    if len(summDF) == 0:
+        for column in columns:
+            outDF[column] = np.nan
+        outDF['section'] = -1
+        return outDF
+
+    rows = trialRows(timestamps, summDF)
+    labels = summDF[columns].reindex(rows)
+    for column in columns:
+        outDF[column] = labels[column].to_numpy()
+
+    starts, ends, _, sections = sectionIntervals(summDF)
+    section = np.full(len(timestamps), -1, dtype=np.int8)
+    if len(starts) > 0:
+        # last interval starting at or before each sample
+        found = np.searchsorted(starts, timestamps, side='right') - 1
+        inside = (found >= 0) & (timestamps <= ends[np.maximum(found, 0)])
+        section[inside] = sections[found[inside]]
+    outDF['section'] = section
+    if dropUnlabelled:
+        outDF = outDF[section >= 0].reset_index(drop=True)
+    return outDF
@@ -0,0 +1,140 @@
+"""
+Seeded, counterbalanced session schedules, generated ahead of time.
+
+A schedule is everything the protocol used to draw at startup: the block
+lengths, the contingency and probability condition of each block and the
+stimulus sequence, plus the forced errors of the feedback of every trial.
+It is made from a single seed with a random.Random, so the seed alone gives
+the same schedule again. Schedules for many
+participants are generated in bulk into an SQLite file with the primary key
+(partID, session, version); the protocol looks its schedule up by partID and
+session at startup, takes the participant's version from it and saves the
+seed and schedule with the session's data.
+
+Counterbalancing follows the participant's position in the list handed to
+generateSchedules: the version and the contingency of the first block
+(color or shape) go through all four combinations every four participants.
+"""
+
+import json
+import os
+import random
+import sqlite3
+import trialDesign
+
+# block design of the experimental trials (see randIntListSetTotal)
+nBlocks = 12
+meanTrials = 16
+minTrials = 10
+maxTrials = 22  # exclusive
+minDiff = 3     # minimum difference between neighbouring block lengths
+
+
+def counterbalance(index):
+    # this function returns (version, first contingency) of participant index
+    return index % 2, (index // 2) % 2
+
+
+def makeSchedule(seed, version, firstContingency=None):
+    """Returns the schedule of one session.
+    Input: seed, version, contingency of the first block (random if None)
+    Output: dictionary of the seed, version and the design lists
+    """
+    rng = random.Random(seed)
+    blockTrialNumbs = trialDesign.randIntListSetTotal(nBlocks, meanTrials, minTrials,
+                                                      maxTrials, minDiff, rng)
+    probabilityConditionList = trialDesign.makeProbabilityConditionList(
+        blockTrialNumbs, rng)
+    return {'seed': seed,
+            'version': version,
+            'blockTrialNumbs': blockTrialNumbs,
+            'contingentBlockList': trialDesign.makeContingentBlockList(
+                blockTrialNumbs, firstContingency, rng),
+            'probabilityConditionList': probabilityConditionList,
+            'stimSequence': trialDesign.randIntNoRepeat(sum(blockTrialNumbs), 0, 3, rng),
+            'forcedErrorList': trialDesign.makeForcedErrorList(
+                blockTrialNumbs, probabilityConditionList, rng)}
+
+
+def openStore(dbPath):
+    # this function returns a connection to the store, made if it is new
+    if os.path.dirname(dbPath):
+        os.makedirs(os.path.dirname(dbPath), exist_ok=True)
+    connection = sqlite3.connect(dbPath)
+    connection.execute("""CREATE TABLE IF NOT EXISTS schedules (
+                              partID TEXT NOT NULL,
+                              session TEXT NOT NULL,
+                              version INTEGER NOT NULL,
+                              seed INTEGER NOT NULL,
+                              schedule TEXT NOT NULL,
+                              PRIMARY KEY (partID, session, version))""")
+    return connection
+
+
+def generateSchedules(dbPath, partIDs, sessions=('0',), masterSeed=0):
+    """Generates the counterbalanced schedules of many participants at once.
+    Schedules already in the store are kept, so participants can be added
+    to the end of partIDs later.
+    Input: path of the store, list of participant IDs (in counterbalancing
+           order), list of sessions, seed the session seeds are drawn from
+    Output: number of schedules added
+    """
+    seeds = random.Random(masterSeed)
+    rows = []
+    for index, partID in enumerate(partIDs):
+        version, firstContingency = counterbalance(index)
+        for session in sessions:
+            seed = seeds.getrandbits(32)
+            schedule = makeSchedule(seed, version, firstContingency)
+            rows.append((str(partID), str(session), version, seed, json.dumps(schedule)))
+    connection = openStore(dbPath)
+    with connection:
+        before = connection.total_changes
+        connection.executemany("INSERT OR IGNORE INTO schedules VALUES (?, ?, ?, ?, ?)",
+                               rows)
+        added = connection.total_changes - before
+    connection.close()
+    return added
+
+
+def saveSchedule(dbPath, partID, session, schedule):
+    # stores a schedule made at startup, an existing one is kept
+    connection = openStore(dbPath)
+    with connection:
+        connection.execute("INSERT OR IGNORE INTO schedules VALUES (?, ?, ?, ?, ?)",
+                           (str(partID), str(session), int(schedule['version']),
+                            schedule['seed'], json.dumps(schedule)))
+    connection.close()
+
+
+def loadSchedule(dbPath, partID, session):
+    """Returns the stored schedule of a session, or None if there is none.
+    The version is not part of the lookup: it is the counterbalanced one
+    stored with the schedule (schedule['version']).
+    A single primary key prefix lookup, however many schedules are stored.
+    """
+    if not os.path.exists(dbPath):
+        return None
+    connection = openStore(dbPath)
+    rows = connection.execute("SELECT version, schedule FROM schedules WHERE partID = ? "
+                              "AND session = ?", (str(partID), str(session))).fetchall()
+    connection.close()
+    if len(rows) == 0:
+        return None
+    if len(rows) > 1:
+        raise ValueError(f"{partID} session {session} has schedules of versions "
+                         f"{sorted(row[0] for row in rows)}, keep one of them")
+    schedule = json.loads(rows[0][1])
+    if 'forcedErrorList' not in schedule:
+        # a schedule is only reproduced by makeSchedule from its seed as a whole
+        raise ValueError(f"stored schedule of {partID} session {session} has no "
+                         f"forcedErrorList, generate it again")
+    return schedule
+
+
+if __name__ == '__main__':
+    dbPath = 'data/schedules.sqlite'
+    partIDs = [f"{i:03d}" for i in range(200)]
+    sessions = ['0', '1']
+    masterSeed = 20190919
+    print(f"{generateSchedules(dbPath, partIDs, sessions, masterSeed)} schedules added")
@@ -0,0 +1,113 @@
+"""
+Frame timing of the trial screens.
+
+Every screen loop records the time returned by win.flip() into a
+preallocated array. At the end of the screen the flip intervals are
+summarised (frames shown, refreshes missed, longest and 95th percentile
+interval) and stored in the trial record next to the screen's
+*StartTime/*EndTime, so every trial shows whether its screens kept time.
+"""
+
+import numpy as np
+
+# statistics stored per screen, as f"{screen}{stat}" trial keys
+frameStats = ['Frames', 'Dropped', 'MaxFrame', 'P95Frame']
+
+
+def frameStatKeys(screens):
+    # this function returns the trial keys for the frame statistics of screens
+    return [f"{screen}{stat}" for screen in screens for stat in frameStats]
+
+
+class FrameTimer:
+    """Records the flip times of one screen at a time.
+    Input: refresh rate of the monitor in Hz
+           number of flips to preallocate for (doubled when exceeded)
+    """
+
+    def __init__(self, refreshRate, capacity=4096):
+        self.frameDur = 1.0 / refreshRate
+        self.flipTimes = np.zeros(capacity)
+        self.n = 0
+
+    def reset(self):
+        # start recording a new screen
+        self.n = 0
+
+    def record(self, flipTime):
+        # store the time of one flip (the return value of win.flip())
+        if self.n == len(self.flipTimes):
+            self.flipTimes = np.concatenate((self.flipTimes, np.zeros(len(self.flipTimes))))
+        self.flipTimes[self.n] = flipTime
+        self.n += 1
+
+    def stats(self):
+        """Returns the frame statistics of the recorded screen.
+        Output: dictionary with
+            Frames: number of flips
+            Dropped: number of refreshes missed between flips
+            MaxFrame/P95Frame: longest and 95th percentile flip interval (s)
+        """
+        intervals = np.diff(self.flipTimes[:self.n])
+        if len(intervals) == 0:
+            return {'Frames': self.n, 'Dropped': 0, 'MaxFrame': None, 'P95Frame': None}
+        missed = np.maximum(np.rint(intervals / self.frameDur) - 1, 0)
+        return {'Frames': self.n,
+                'Dropped': int(missed.sum()),
+                'MaxFrame': float(intervals.max()),
+                'P95Frame': float(np.percentile(intervals, 95))}
+
+    def store(self, record, screen):
+        # write the statistics into the trial record as f"{screen}{stat}"
+        for stat, value in self.stats().items():
+            record[f"{screen}{stat}"] = value
+
+    def clear(self, record, screen):
+        # empty the statistics of a screen that was not shown in this trial
+        for stat in frameStats:
+            record[f"{screen}{stat}"] = None
+
+
+class ScreenScheduler:
+    """Runs screens until a target flip time instead of for a frame count.
+    Times are on the PTB clock of win.getFutureFlipTime. A screen that
+    follows another one directly starts at the previous screen's deadline
+    rather than at the time it actually got there, so rounding to whole
+    frames never adds up over a session and fractional durations (e.g.
+    0.985s) are kept exactly on average.
+    Usage:
+        scheduler.start(duration)
+        while scheduler.running():
+            ...draw...
+            win.flip()
+    Input: window, refresh rate of the monitor in Hz
+    """
+
+    def __init__(self, win, refreshRate):
+        self.win = win
+        self.frameDur = 1.0 / refreshRate
+        self.deadline = None
+
+    def nextFlip(self):
+        # time at which the frame drawn now will be shown
+        return self.win.getFutureFlipTime(clock='ptb')
+
+    def start(self, duration):
+        """Starts a screen that lasts duration seconds.
+        Output: the (PTB) time the screen starts at
+        """
+        nextFlip = self.nextFlip()
+        if self.deadline is not None and abs(self.deadline - nextFlip) < self.frameDur:
+            startTime = self.deadline   # carry on from the previous screen
+        else:
+            startTime = nextFlip        # first screen, or after a pause
+        self.deadline = startTime + duration
+        return startTime
+
+    def running(self):
+        # True while the next flip is shown before the deadline
+        return self.nextFlip() < self.deadline - self.frameDur / 2
+
+    def stop(self):
+        # the screen ended early, the next one starts from the actual time
+        self.deadline = None
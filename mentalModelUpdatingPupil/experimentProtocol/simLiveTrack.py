@@ -0,0 +1,233 @@
+"""
+Stand-in for the LiveTrack module that makes up its own eye data.
+
+It has the LiveTrack functions the protocol and calibrate.py call, and
+returns samples as EyeData structures at 500Hz. Samples are generated
+on demand, for the time that has passed on the clock set with setClock,
+so the tracker keeps up with a simulated clock that runs faster than real
+time. The data looks like a real recording where it matters to the later
+processing:
+    - blinks (both eyes untracked, pupil 0) about 15 times a minute
+    - a slowly changing pupil size with sample noise
+    - Timestamp (ms) restarts from 0 every time tracking is started again
+Used by the headless mode of expProtocol (see headless) and the benchmarks.
+"""
+
+import ctypes
+import threading
+import time
+import numpy as np
+
+sampleRate = 500    # Hz
+blinkRate = 15 / 60     # blinks per second
+blinkDur = (0.1, 0.4)   # shortest and longest blink in seconds
+
+
+class EyeData(ctypes.Structure):
+    # fields of the LiveTrack result structure used in this repository
+    _fields_ = [('Timestamp', ctypes.c_int),
+                ('Trigger', ctypes.c_int),
+                ('Tracked', ctypes.c_bool),
+                ('TrackedRight', ctypes.c_bool),
+                ('GazeX', ctypes.c_double),
+                ('GazeY', ctypes.c_double),
+                ('GazeXRight', ctypes.c_double),
+                ('GazeYRight', ctypes.c_double),
+                ('PupilMajorAxis', ctypes.c_double),
+                ('PupilMinorAxis', ctypes.c_double),
+                ('PupilMajorAxisRight', ctypes.c_double),
+                ('PupilMinorAxisRight', ctypes.c_double),
+                ('VectX', ctypes.c_double),
+                ('VectY', ctypes.c_double),
+                ('GlintX', ctypes.c_double),
+                ('GlintY', ctypes.c_double),
+                ('VectXRight', ctypes.c_double),
+                ('VectYRight', ctypes.c_double),
+                ('GlintXRight', ctypes.c_double),
+                ('GlintYRight', ctypes.c_double)]
+
+
+eyeDtype = np.dtype(EyeData)
+
+
+def makeSamples(start, n, rng, blinkUntil=0):
+    """Returns n synthetic samples as an EyeData structured array.
+    Input: index of the first sample since tracking started
+           number of samples
+           numpy random generator
+           sample index until which a blink that started earlier lasts
+    Output: array of samples, sample index until which the last blink lasts
+    """
+    samples = np.zeros(n, dtype=eyeDtype)
+    index = start + np.arange(n)
+    t = index / sampleRate
+    samples['Timestamp'] = index * (1000 // sampleRate)
+    # pupil: slow changes of a few camera pixels around 30 plus sample noise
+    pupil = 30 + 2 * np.sin(2 * np.pi * t / 7) + np.sin(2 * np.pi * t / 1.3)
+    noise = rng.normal(0, 0.15, (2, n))
+    for eye, (major, minor) in enumerate([('PupilMajorAxis', 'PupilMinorAxis'),
+                                          ('PupilMajorAxisRight', 'PupilMinorAxisRight')]):
+        samples[major] = pupil + noise[eye]
+        samples[minor] = 0.9 * samples[major]
+    # gaze (screen pixels) and pupil-glint vectors (camera pixels) near centre
+    for field in ['GazeX', 'GazeY', 'GazeXRight', 'GazeYRight']:
+        samples[field] = rng.normal(0, 8, n)
+    for field in ['VectX', 'VectY', 'VectXRight', 'VectYRight']:
+        samples[field] = rng.normal(0, 0.4, n)
+    for field, centre in [('GlintX', 320), ('GlintY', 240),
+                          ('GlintXRight', 960), ('GlintYRight', 240)]:
+        samples[field] = centre + rng.normal(0, 0.3, n)
+    # blinks: a few random onsets, each lasting blinkDur
+    isBlink = np.zeros(n, dtype=bool)
+    isBlink[:max(min(blinkUntil - start, n), 0)] = True
+    for onset in np.flatnonzero(rng.random(n) < blinkRate / sampleRate):
+        end = onset + int(rng.uniform(*blinkDur) * sampleRate)
+        isBlink[onset:end] = True
+        blinkUntil = max(blinkUntil, start + end)
+    samples['Tracked'] = ~isBlink
+    samples['TrackedRight'] = ~isBlink
+    for field in ['PupilMajorAxis', 'PupilMinorAxis', 'PupilMajorAxisRight',
+                  'PupilMinorAxisRight']:
+        samples[field][isBlink] = 0
+    return samples, blinkUntil
+
+
+def toStructs(samples):
+    # this function returns a structured array as a list of EyeData, like
+    # LiveTrack.GetBufferedEyePositions (the structures share its memory)
+    return list((EyeData * len(samples)).from_buffer(samples))
+
+
+class SimTracker:
+    """State of the simulated tracker.
+    Input: function returning the current time in seconds
+           seed of the random generator
+    """
+
+    def __init__(self, clock=time.perf_counter, seed=None):
+        self.clock = clock
+        self.rng = np.random.default_rng(seed)
+        self.lock = threading.Lock()
+        self.tracking = False
+        self.startTime = 0.0
+        self.nGenerated = 0     # samples since tracking started
+        self.blinkUntil = 0
+        self.buffer = np.zeros(0, dtype=eyeDtype)
+        self.last = np.zeros(1, dtype=eyeDtype)
+
+    def update(self):
+        # generate the samples up to the current time into the buffer
+        if not self.tracking:
+            return
+        n = int((self.clock() - self.startTime) * sampleRate) - self.nGenerated
+        if n > 0:
+            samples, self.blinkUntil = makeSamples(self.nGenerated, n, self.rng,
+                                                   self.blinkUntil)
+            self.buffer = np.concatenate((self.buffer, samples))
+            self.last = samples[-1:]
+            self.nGenerated += n
+
+    def start(self):
+        with self.lock:
+            if not self.tracking:
+                self.tracking = True
+                self.startTime = self.clock()
+                self.nGenerated = 0
+                self.blinkUntil = 0
+
+    def stop(self):
+        with self.lock:
+            self.update()
+            self.tracking = False
+
+    def take(self, fromBeginning, numberOfSamples, removeFromBuffer):
+        with self.lock:
+            self.update()
+            n = len(self.buffer) if numberOfSamples <= 0 else min(numberOfSamples,
+                                                                  len(self.buffer))
+            if fromBeginning:
+                samples = self.buffer[:n]
+                rest = self.buffer[n:]
+            else:
+                samples = self.buffer[len(self.buffer) - n:]
+                rest = self.buffer[:len(self.buffer) - n]
+            if removeFromBuffer:
+                self.buffer = rest.copy()
+            return toStructs(samples.copy())
+
+    def lastResult(self):
+        with self.lock:
+            self.update()
+            return toStructs(self.last.copy())[0]
+
+    def clear(self):
+        with self.lock:
+            self.update()
+            self.buffer = np.zeros(0, dtype=eyeDtype)
+
+
+tracker = SimTracker()
+
+
+def setClock(clock, seed=None):
+    # use clock (a function returning seconds) as the time of the tracker
+    global tracker
+    tracker = SimTracker(clock, seed)
+
+
+# LiveTrack functions
+def Init():
+    pass
+
+
+def Close():
+    tracker.stop()
+
+
+def StartTracking():
+    tracker.start()
+
+
+def StopTracking():
+    tracker.stop()
+
+
+def ClearDataBuffer():
+    tracker.clear()
+
+
+def SetResultsTypeCalibrated():
+    pass
+
+
+def SetResultsTypeRaw():
+    pass
+
+
+def GetCaptureConfig():
+    # [width, height, sampleRate, offsetX, offsetY] of the camera
+    return [1280, 480, sampleRate, 0, 0]
+
+
+def GetTracking():
+    # [trackLeftEye, trackRightEye]
+    return [1, 1]
+
+
+def GetLastResult():
+    return tracker.lastResult()
+
+
+def GetBufferedEyePositions(fromBeginning=0, numberOfSamples=0, removeFromBuffer=1):
+    # numberOfSamples 0 returns the whole buffer
+    return tracker.take(fromBeginning, numberOfSamples, removeFromBuffer)
+
+
+def GetFieldAsList(data, field):
+    return [getattr(sample, field) for sample in data]
+
+
+def CalibrateDevice(eye, nPoints, targetX, targetY, vectX, vectY, viewDist,
+                    glintX, glintY):
+    # sum of squared errors in pixels, as from a good calibration
+    return 4.0 * nPoints
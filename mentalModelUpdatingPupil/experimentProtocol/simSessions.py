@@ -0,0 +1,75 @@
+"""
+Runs many headless sessions of the protocol (see headless) and collects
+their reports.
+
+Every session is its own `expProtocol.py --headless` process, so sessions
+share nothing but the disk and can run in parallel. Each session writes its
+data under {outDir}/data/sim{n}/ like a real one, and the JSON report it
+prints is appended to {outDir}/simSessions.jsonl.
+"""
+
+import json
+import os
+import subprocess
+import sys
+from multiprocessing.pool import ThreadPool
+import numpy as np
+
+protocolPath = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'expProtocol.py')
+
+
+def runSession(task):
+    """Runs one headless session.
+    Input: tuple of (session number, output directory, seed)
+    Output: dictionary of the session report, or of the error
+    """
+    n, outDir, seed = task
+    command = [sys.executable, protocolPath, '--headless',
+               '--partID', f"sim{n:04d}", '--session', '0',
+               '--version', str(n % 2), '--seed', str(seed)]
+    result = subprocess.run(command, cwd=outDir, capture_output=True, text=True)
+    lines = result.stdout.strip().splitlines()
+    if result.returncode != 0 or not lines or not lines[-1].startswith('{'):
+        return {'session': n, 'error': result.stderr[-2000:]}
+    return json.loads(lines[-1])
+
+
+def runSessions(nSessions, outDir, processes=None, firstSeed=0):
+    """Runs nSessions headless sessions, processes at a time.
+    Output: list of session reports
+    """
+    os.makedirs(outDir, exist_ok=True)
+    tasks = [(n, outDir, firstSeed + n) for n in range(nSessions)]
+    reports = []
+    with open(os.path.join(outDir, 'simSessions.jsonl'), 'a') as reportFile:
+        with ThreadPool(processes or os.cpu_count()) as pool:
+            for report in pool.imap_unordered(runSession, tasks):
+                reportFile.write(json.dumps(report) + '\n')
+                reportFile.flush()
+                reports.append(report)
+    return reports
+
+
+def summarize(reports):
+    # this function returns the totals over the sessions that finished
+    done = [report for report in reports if 'error' not in report]
+    if not done:
+        return {'sessions': 0, 'failed': len(reports)}
+    return {'sessions': len(done),
+            'failed': len(reports) - len(done),
+            'trials': sum(report['trials'] for report in done),
+            'bytesWritten': sum(report['bytesWritten'] for report in done),
+            'wallTimeMean': float(np.mean([report['wallTime'] for report in done])),
+            'trialsPerSecMean': float(np.mean([report['trialsPerSec'] for report in done])),
+            'saveTimeMax': max(report['saveTimeMax'] for report in done),
+            'latencyMean': float(np.mean([report['latencyMean'] for report in done])),
+            'latencyMax': max(report['latencyMax'] for report in done)}
+
+
+if __name__ == '__main__':
+    nSessions = 8
+    outDir = 'simData'
+    processes = None    # one session per CPU
+    reports = runSessions(nSessions, outDir, processes)
+    print(json.dumps(summarize(reports)))
@@ -0,0 +1,57 @@
+"""
+Stimuli that are built once and reused for the whole session.
+
+Building a visual.TextStim lays out its glyphs and uploads a texture, which
+takes milliseconds on the drawing thread. The instruction, break and points
+screens used to build a new TextStim every time they were shown. A
+StimulusCache builds every stimulus once at startup under a key and hands
+the same object back afterwards. Text that changes (e.g. the points
+percentage) is set on the cached stimulus in place, and only when it is
+different from what is already shown.
+"""
+
+
+class StimulusCache:
+    """Keyed store of the stimuli of one window.
+    Input: psychopy window
+           TextStim class (psychopy.visual.TextStim, or the headless one)
+    """
+
+    def __init__(self, win, textType):
+        self.win = win
+        self.textType = textType
+        self.stims = {}
+
+    def add(self, key, stimType, **kwargs):
+        """Builds a stimulus once.
+        Input: key to get it back with
+               psychopy stimulus class (e.g. visual.Circle)
+               arguments of the stimulus (win is filled in)
+        Output: the stimulus
+        """
+        if key not in self.stims:
+            self.stims[key] = stimType(win=self.win, **kwargs)
+        return self.stims[key]
+
+    def addText(self, key, text, **kwargs):
+        # builds a TextStim once, see add
+        return self.add(key, self.textType, text=text, **kwargs)
+
+    def __getitem__(self, key):
+        return self.stims[key]
+
+    def text(self, key, text):
+        """Returns the cached TextStim of key showing text.
+        The text is only set (and laid out again) when it changed.
+        """
+        stim = self.stims[key]
+        if stim.text != text:
+            stim.text = text
+        return stim
+
+    def warmUp(self):
+        # draw every stimulus once to upload its texture, then clear the
+        # back buffer so nothing is shown
+        for stim in self.stims.values():
+            stim.draw()
+        self.win.clearBuffer()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the protocol modules import each other by name from experimentProtocol
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,39 @@
+import random
+import numpy as np
+import fixationDetector
+
+
+def test_slidingRange():
+    rng = random.Random(0)
+    for n in [1, 3, 10]:
+        window = fixationDetector.SlidingRange(n)
+        values = [rng.choice([rng.random(), float(rng.randrange(5))]) for _ in range(300)]
+        for i, value in enumerate(values):
+            window.push(value)
+            last = values[max(i + 1 - n, 0):i + 1]
+            assert window.range() == max(last) - min(last)
+
+
+def samples(vectX, tracked):
+    # structured array of left eye samples (see eyeRecorder.samplesArray)
+    dtype = np.dtype([(field, np.float64) for field in fixationDetector.EyeWindow.fields] +
+                     [('Tracked', np.int32)])
+    array = np.zeros(len(vectX), dtype=dtype)
+    array['VectX'] = vectX
+    array['Tracked'] = tracked
+    return array
+
+
+def test_eyeWindowUntracked():
+    window = fixationDetector.EyeWindow(5)
+    window.push(samples([1.0] * 4, [1] * 4))
+    assert not window.isFixation(0.5)       # the window is not full yet
+    window.push(samples([1.0, 1.0], [0, 1]))
+    assert not window.isFixation(0.5)       # an untracked sample in the window
+    window.push(samples([1.2] * 3, [1] * 3))
+    assert not window.isFixation(0.5)       # still in the window
+    window.push(samples([1.2], [1]))
+    assert window.isFixation(0.5)           # left the window
+    assert window.medians()[0] == 1.2
+    window.push(samples([2.0], [1]))
+    assert not window.isFixation(0.5)       # moved too far
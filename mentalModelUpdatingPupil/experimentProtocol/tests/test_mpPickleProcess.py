@@ -0,0 +1,88 @@
+import os
+import pickle
+import threading
+import benchEyeData
+import mpPickleProcess
+
+
+def consume(filePaths, outcome):
+    # runs mpFunc to the end and records what it returned or raised
+    try:
+        outcome['frames'] = list(mpPickleProcess.mpFunc(filePaths, processes=2))
+    except Exception as error:
+        outcome['error'] = error
+
+
+def runWithTimeout(filePaths, timeout=60):
+    outcome = {}
+    thread = threading.Thread(target=consume, args=(filePaths, outcome), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "mpFunc hung"
+    return outcome
+
+
+def trialPaths(dirPath, nTrials):
+    benchEyeData.makeTrialPickles(dirPath, nTrials, 200)
+    return [os.path.join(dirPath, str(trial)) for trial in range(nTrials)]
+
+
+def test_mpFuncConvertsInOrder(tmp_path):
+    filePaths = trialPaths(str(tmp_path), 20)
+    outcome = runWithTimeout(filePaths)
+    assert [filePath for filePath, _ in outcome['frames']] == filePaths
+    for filePath, outDF in outcome['frames']:
+        with open(filePath, 'rb') as pickleObject:
+            data = pickle.load(pickleObject)
+        assert outDF['Timestamp'].tolist() == [sample.Timestamp for sample in data]
+
+
+def test_mpFuncRaisesOnBadPickle(tmp_path):
+    filePaths = trialPaths(str(tmp_path), 20)
+    with open(filePaths[7], 'wb') as pickleObject:
+        pickleObject.write(b'not a pickle')
+    outcome = runWithTimeout(filePaths)
+    assert isinstance(outcome.get('error'), pickle.UnpicklingError)
+
+
+def test_mpFuncStopsWhenCallerFails(tmp_path):
+    filePaths = trialPaths(str(tmp_path), 20)
+    outcome = {}
+
+    def failingConsumer():
+        try:
+            for filePath, outDF in mpPickleProcess.mpFunc(filePaths, processes=2):
+                raise OSError("disk full")
+        except OSError as error:
+            outcome['error'] = error
+
+    thread = threading.Thread(target=failingConsumer, daemon=True)
+    thread.start()
+    thread.join(60)
+    assert not thread.is_alive(), "mpFunc hung"
+    assert isinstance(outcome['error'], OSError)
+
+
+def recordSession(dataDir, trialDir):
+    # records the trials of trialDir with an EyeRecorder, like saveTrialData
+    import eyeRecorder
+    os.makedirs(dataDir)
+    recorder = eyeRecorder.EyeRecorder(dataDir)
+    for trial, samples in enumerate(benchEyeData.loadTrials(trialDir)):
+        recorder.append(trial, samples)
+    recorder.close()
+
+
+def test_convertSessionRecorded(tmp_path):
+    trialDir = str(tmp_path / 'pickles')
+    trialPaths(trialDir, 5)
+    recordDir = str(tmp_path / 'recorded')
+    recordSession(recordDir, trialDir)
+    pickleCsv = str(tmp_path / 'pickles.csv')
+    recordedCsv = str(tmp_path / 'recorded.csv')
+    mpPickleProcess.convertSession(trialDir, pickleCsv, processes=2)
+    assert mpPickleProcess.convertSession(recordDir, recordedCsv) == [str(i) for i in range(5)]
+    with open(pickleCsv, 'rb') as pickleFile, open(recordedCsv, 'rb') as recordedFile:
+        assert pickleFile.read() == recordedFile.read()
+    # nothing changed, nothing to convert again
+    assert mpPickleProcess.convertSession(recordDir, recordedCsv) == []
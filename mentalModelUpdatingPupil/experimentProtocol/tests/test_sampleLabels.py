@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+import sampleLabels
+
+
+def summary(lastResponded):
+    # two trials, the last one with or without a response
+    summDF = pd.DataFrame({'trialTotal': [0, 1],
+                           'pointsStartTime': [0.0, 100.0],
+                           'stimStartTime': [10.0, 110.0],
+                           'respStartTime': [20.0, 120.0],
+                           'noRespEndTime': [np.nan, 150.0],
+                           'fixStartTime': [30.0, 130.0],
+                           'feedbackStartTime': [40.0, 140.0],
+                           'feedbackEndTime': [50.0, 150.0]})
+    if not lastResponded:
+        summDF.loc[1, ['fixStartTime', 'feedbackStartTime', 'feedbackEndTime']] = np.nan
+    return summDF
+
+
+def test_labelSamples():
+    eyeDF = pd.DataFrame({'Timestamp': np.arange(0, 200, 5)})
+    outDF = sampleLabels.labelSamples(eyeDF, summary(True))
+    trial = outDF['trialTotal'].to_numpy()
+    assert (trial[eyeDF['Timestamp'] < 100] == 0).all()
+    assert (trial[(eyeDF['Timestamp'] >= 100) & (eyeDF['Timestamp'] <= 150)] == 1).all()
+    assert np.isnan(trial[eyeDF['Timestamp'] > 150]).all()
+    assert outDF['section'][eyeDF['Timestamp'] == 45].item() == 4
+
+
+def test_labelSamplesLastTrialNoResponse():
+    eyeDF = pd.DataFrame({'Timestamp': np.arange(0, 200, 5)})
+    outDF = sampleLabels.labelSamples(eyeDF, summary(False))
+    trial = outDF['trialTotal'].to_numpy()
+    assert (trial[(eyeDF['Timestamp'] >= 100) & (eyeDF['Timestamp'] <= 150)] == 1).all()
+    assert np.isnan(trial[eyeDF['Timestamp'] > 150]).all()
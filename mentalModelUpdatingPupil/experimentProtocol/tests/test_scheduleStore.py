@@ -0,0 +1,18 @@
+import pytest
+import scheduleStore
+
+
+def test_loadScheduleTakesStoredVersion(tmp_path):
+    dbPath = str(tmp_path / 'schedules.sqlite')
+    scheduleStore.generateSchedules(dbPath, ['000', '001'], ['0'], masterSeed=1)
+    assert scheduleStore.loadSchedule(dbPath, '000', '0')['version'] == 0
+    assert scheduleStore.loadSchedule(dbPath, '001', '0')['version'] == 1
+    assert scheduleStore.loadSchedule(dbPath, '002', '0') is None
+
+
+def test_loadScheduleOfTwoVersions(tmp_path):
+    dbPath = str(tmp_path / 'schedules.sqlite')
+    scheduleStore.generateSchedules(dbPath, ['000', '001'], ['0'], masterSeed=1)
+    scheduleStore.saveSchedule(dbPath, '001', '0', scheduleStore.makeSchedule(7, 0))
+    with pytest.raises(ValueError):
+        scheduleStore.loadSchedule(dbPath, '001', '0')
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import timestampCorrection
+
+
+def session():
+    # eye data of two tracking periods (a break in between) and the summary
+    # times of three trials in each, 2ms samples
+    eyeTimestamps = np.concatenate([np.arange(0, 1002, 2), np.arange(0, 802, 2)])
+    summDF = pd.DataFrame({'pointsStartTime': [100, 400, 700, 100, 400, 700],
+                           'pointsEndTime': [200, 500, 800, 200, 500, 790]})
+    return eyeTimestamps, summDF
+
+
+def test_correctSummary():
+    eyeTimestamps, summDF = session()
+    outDF = timestampCorrection.correctSummary(summDF, eyeTimestamps)
+    assert outDF['pointsStartTime'].tolist() == [100, 400, 700, 1100, 1400, 1700]
+    assert outDF['pointsEndTime'].tolist() == [200, 500, 800, 1200, 1500, 1790]
+
+
+def test_correctSummaryStaleReads():
+    # GetLastResult right after StartTracking gives the last time before the
+    # reset: at the start of the session (from before the recording) and
+    # after the break (the end of the first period)
+    eyeTimestamps, summDF = session()
+    summDF.loc[0, 'pointsStartTime'] = 600
+    summDF.loc[3, 'pointsStartTime'] = 1000
+    outDF = timestampCorrection.correctSummary(summDF, eyeTimestamps)
+    assert outDF['pointsStartTime'].tolist() == [0, 400, 700, 1000, 1400, 1700]
+    assert outDF['pointsEndTime'].tolist() == [200, 500, 800, 1200, 1500, 1790]
+    times = outDF[['pointsStartTime', 'pointsEndTime']].to_numpy().ravel()
+    assert (np.diff(times) >= 0).all()
+
+
+def test_correctTimestamps():
+    eyeTimestamps, _ = session()
+    corrected = timestampCorrection.correctTimestamps(eyeTimestamps)
+    assert (np.diff(corrected) >= 0).all()
+    assert corrected[-1] == 1000 + 800
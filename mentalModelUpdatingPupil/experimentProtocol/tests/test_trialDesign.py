@@ -0,0 +1,20 @@
+import random
+import pytest
+import trialDesign
+
+
+def test_randIntListSetTotal():
+    rng = random.Random(0)
+    for _ in range(200):
+        blocks = trialDesign.randIntListSetTotal(12, 16, 10, 22, 3, rng)
+        assert len(blocks) == 12
+        assert sum(blocks) == 12 * 16
+        assert all(10 <= block < 22 for block in blocks)
+        assert all(abs(a - b) >= 3 for a, b in zip(blocks, blocks[1:]))
+
+
+def test_randIntListSetTotalImpossible():
+    with pytest.raises(ValueError):
+        trialDesign.randIntListSetTotal(4, 16, 10, 22, 12)  # neighbours too far apart
+    with pytest.raises(ValueError):
+        trialDesign.randIntListSetTotal(4, 30, 10, 22, 0)   # total out of reach
@@ -0,0 +1,38 @@
+import os
+import shutil
+import trialWriter
+
+columns = ['trialTotal', 'block', 'resp']
+trials = [{'trialTotal': k, 'block': k // 2, 'resp': None if k == 1 else 'up'}
+          for k in range(4)]
+
+
+def test_recover(tmp_path):
+    # the whole session written and closed
+    cleanPath = str(tmp_path / 'clean.csv')
+    writer = trialWriter.TrialWriter(cleanPath, columns, syncEvery=10)
+    for trial in trials:
+        writer.write(trial)
+    writer.close()
+
+    # a crash after three trials: the CSV on disk is as synced at the start
+    # plus a cut off row, and the journal ends in a cut off line
+    livePath = str(tmp_path / 'live.csv')
+    writer = trialWriter.TrialWriter(livePath, columns, syncEvery=10)
+    for trial in trials[:3]:
+        writer.write(trial)
+    crashPath = str(tmp_path / 'crash.csv')
+    shutil.copy(livePath, crashPath)
+    shutil.copy(livePath + '.journal', crashPath + '.journal')
+    writer.close()
+    with open(crashPath, 'a', newline='') as csvFile:
+        csvFile.write('0,0')
+    with open(crashPath + '.journal', 'a', newline='') as journalFile:
+        journalFile.write('3,1')
+
+    writer = trialWriter.TrialWriter(crashPath, columns, syncEvery=10)
+    writer.write(trials[3])
+    writer.close()
+    with open(cleanPath, newline='') as clean, open(crashPath, newline='') as crash:
+        assert crash.read() == clean.read()
+    assert not os.path.exists(crashPath + '.journal')
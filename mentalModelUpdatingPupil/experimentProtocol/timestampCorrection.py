@@ -0,0 +1,168 @@
+"""
+Timestamp correction for the eye and trial summary data.
+
+LiveTrack resets its Timestamp every time tracking stops (lt.StopTracking in
+breakSection and around calibration). Like the R correction in
+supplament/01-timestampCorrection.Rmd, the last timestamp before a reset is
+added to every sample after it, which gives one monotonic session time. The
+resets are found with a single diff over the column and the offsets with a
+single cumsum, so the correction is linear in the number of samples. The
+trial summary times get the offsets of the eye data segments they were
+recorded in, where stale times read right after a restart of the tracking
+are told apart from real resets (see assignSegments).
+"""
+
+import numpy as np
+import pandas as pd
+
+# time columns written by saveTrialData, in the order they happen in a trial
+timeColumns = ['pointsStartTime', 'pointsEndTime', 'stimStartTime',
+               'stimEndTime', 'respStartTime', 'respEndTime', 'noRespStartTime',
+               'noRespEndTime', 'fixStartTime', 'fixEndTime',
+               'feedbackStartTime', 'feedbackEndTime']
+
+
+def findResets(timestamps):
+    # this function returns the index of the first sample after each reset
+    return np.flatnonzero(np.diff(timestamps) < 0) + 1
+
+
+def segmentOffsets(timestamps):
+    """Returns where each segment between resets starts and its offset.
+    The offset of a segment is the corrected timestamp of the last sample
+    before it, the first segment has no offset.
+    Input: array of raw timestamps in recording order
+    Output: array of segment start indices, array of segment offsets
+    """
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    resets = findResets(timestamps)
+    starts = np.concatenate(([0], resets))
+    offsets = np.concatenate(([0], np.cumsum(timestamps[resets - 1])))
+    return starts, offsets
+
+
+def correctTimestamps(timestamps):
+    """Returns monotonic session timestamps.
+    Input: array of raw timestamps in recording order
+    Output: int64 array of corrected timestamps
+    """
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    if len(timestamps) == 0:
+        return timestamps
+    starts, offsets = segmentOffsets(timestamps)
+    lengths = np.diff(np.append(starts, len(timestamps)))
+    return timestamps + np.repeat(offsets, lengths)
+
+
+def assignSegments(values, eyeFirst, eyeLast):
+    """Returns the eye data segment of every summary time.
+    A reset in the summary times only counts when it lines up with a reset in
+    the eye data. A time read with GetLastResult right after StartTracking
+    can be stale (from before the reset), which looks like an extra reset in
+    the summary. So the times are assigned to segments such that each time
+    lies in the raw range of its segment, the segments follow the recording
+    order and the times within a segment increase, keeping as many times as
+    possible. The times left out are the stale ones.
+    Input: summary times in recording order
+           first and last raw timestamp of each eye data segment
+    Output: array of eye segment indices (-1 for stale times)
+    """
+    values = np.asarray(values, dtype=np.float64)
+    nValues, nSegments = len(values), len(eyeFirst)
+    inside = ((values[:, None] >= np.asarray(eyeFirst)[None, :]) &
+              (values[:, None] <= np.asarray(eyeLast)[None, :]))
+    # longest chain ending with time i in segment k, and the time before it
+    best = np.zeros((nValues, nSegments), dtype=np.int64)
+    parent = np.full((nValues, nSegments, 2), -1, dtype=np.int64)
+    # longest chain so far ending in each segment, and where it ends
+    segBest = np.zeros(nSegments, dtype=np.int64)
+    segEnd = np.full(nSegments, -1, dtype=np.int64)
+    for i in range(nValues):
+        for k in np.flatnonzero(inside[i]):
+            length, previous = 0, (-1, -1)
+            if k > 0 and segBest[:k].max() > 0:
+                earlier = int(np.argmax(segBest[:k]))
+                length, previous = segBest[earlier], (segEnd[earlier], earlier)
+            before = np.flatnonzero(values[:i] <= values[i])
+            if len(before) > 0 and best[before, k].max() > length:
+                j = before[np.argmax(best[before, k])]
+                length, previous = best[j, k], (j, k)
+            best[i, k] = length + 1
+            parent[i, k] = previous
+        for k in np.flatnonzero(inside[i]):
+            if best[i, k] > segBest[k]:
+                segBest[k], segEnd[k] = best[i, k], i
+    segments = np.full(nValues, -1, dtype=np.int64)
+    if nValues == 0 or segBest.max() == 0:
+        return segments
+    k = int(np.argmax(segBest))
+    i = segEnd[k]
+    while i >= 0:
+        segments[i] = k
+        i, k = parent[i, k]
+    return segments
+
+
+def correctSummary(summDF, eyeTimestamps, columns=None):
+    """Returns a copy of the trial summary with corrected time columns.
+    The same offsets as in the eye data are applied: the time columns of all
+    trials are read in the order they were recorded and every time gets the
+    offset of the eye data segment it was recorded in (see assignSegments).
+    A stale time is set to the start of the segment of the next time, where
+    tracking was started again, kept between its neighbours.
+    Input: dataframe written by saveTrialData (one row per trial)
+           raw Timestamp column of the eye data of the same session
+           time columns to correct (default: timeColumns present in summDF)
+    Output: corrected dataframe
+    """
+    if columns is None:
+        columns = [column for column in timeColumns if column in summDF.columns]
+    eyeTimestamps = np.asarray(eyeTimestamps, dtype=np.int64)
+    outDF = summDF.copy()
+    if len(eyeTimestamps) == 0 or len(columns) == 0:
+        return outDF
+    times = outDF[columns].to_numpy(dtype=np.float64).ravel()
+    valid = np.flatnonzero(~np.isnan(times))
+    values = times[valid]
+    eyeStarts, eyeOffsets = segmentOffsets(eyeTimestamps)
+    eyeEnds = np.append(eyeStarts[1:], len(eyeTimestamps)) - 1
+    segments = assignSegments(values, eyeTimestamps[eyeStarts], eyeTimestamps[eyeEnds])
+    kept = np.flatnonzero(segments >= 0)
+    if len(kept) == 0:
+        return outDF
+    corrected = values + eyeOffsets[np.maximum(segments, 0)]
+    stale = np.flatnonzero(segments < 0)
+    if len(stale) > 0:
+        # the next and the last kept time around each stale time
+        nextKept = kept[np.minimum(np.searchsorted(kept, stale), len(kept) - 1)]
+        lastKept = kept[np.maximum(np.searchsorted(kept, stale) - 1, 0)]
+        restart = (eyeTimestamps[eyeStarts] + eyeOffsets)[segments[nextKept]]
+        corrected[stale] = np.minimum(restart, corrected[nextKept])
+        corrected[stale] = np.where(stale > lastKept,
+                                    np.maximum(corrected[stale], corrected[lastKept]),
+                                    corrected[stale])
+    times[valid] = corrected
+    times = times.reshape(len(outDF), len(columns))
+    for i, column in enumerate(columns):
+        outDF[column] = times[:, i]
+    return outDF
+
+
+def correctSession(eyeDF, summDF):
+    """Returns the eye data and trial summary of a session with corrected
+    timestamps (see correctTimestamps and correctSummary).
+    """
+    outEyeDF = eyeDF.copy()
+    outEyeDF['Timestamp'] = correctTimestamps(eyeDF['Timestamp'].to_numpy())
+    return outEyeDF, correctSummary(summDF, eyeDF['Timestamp'].to_numpy())
+
+
+if __name__ == '__main__':
+    eyeFileName = 'data/eyeDataRaw/000_0Eye.csv'
+    summFileName = 'data/summDataRaw/000_0data.csv'
+    eyeDat = pd.read_csv(eyeFileName)
+    summDat = pd.read_csv(summFileName)
+    print(f"{len(findResets(eyeDat['Timestamp'].to_numpy()))} timestamp resets")
+    eyeDat, summDat = correctSession(eyeDat, summDat)
+    eyeDat.to_csv('data/eyeDataRawFixed/000_0EyeDataV2.csv', index=False)
+    summDat.to_csv('data/summDataFixed/000_0SummDataV2.csv', index=False)
@@ -0,0 +1,172 @@
+"""
+Trial design of the protocol: block lengths, block conditions and the
+stimulus sequence of a session.
+Every function draws from rng, the random module by default, so a
+random.Random(seed) gives the same design again (see scheduleStore).
+"""
+
+import random
+import numpy as np
+
+
+def randIntNoRepeat(numb, min, max, rng=random):
+    """Function to create a list of integers that do not repeat subsequently.
+    This is being used to create a list of which stimulus to present.
+    Input: number of elements,
+           minimum integer value
+           maximum integer value
+    Output: a list of
+    """
+    outList = []
+    for i in range(numb):
+        if len(outList) == 0:
+            outList.append(rng.randint(min, max))
+        else:
+            while True:
+                pick = rng.randint(min, max)
+                if outList[-1] != pick:
+                    outList.append(pick)
+                    break
+    return outList
+
+
+def blockWeights(nVal, total, values, reapVal):
+    """Returns the weights the list sampler draws from.
+    f[k][p, r] is the chance that k more values drawn one at a time (each
+    uniform over the values at least reapVal away from the one before) add up
+    to r, when the value before them is values[p].
+    Input: number of values, their total, array of the values to draw from,
+           minimum difference between neighbouring values
+    Output: list of nVal arrays f[0]..f[nVal-1] of shape (len(values), total+1),
+            chance of each value following each value (len(values) squared)
+    """
+    allowed = np.abs(values[:, None] - values[None, :]) >= reapVal
+    nAllowed = allowed.sum(axis=1, keepdims=True)
+    step = np.divide(allowed, nAllowed, out=np.zeros(allowed.shape),
+                     where=nAllowed > 0)
+    f = [np.zeros((len(values), total + 1))]
+    f[0][:, 0] = 1
+    for k in range(1, nVal):
+        # g[v, r]: chance to finish with k-1 more values after v, v included
+        g = np.zeros_like(f[-1])
+        for v, value in enumerate(values):
+            if value <= total:
+                g[v, value:] = f[-1][v, :total + 1 - value]
+        f.append(step @ g)
+    return f, step
+
+
+def randIntListSetTotal(nVal=1, meanVal=0, minVal=0, maxVal=0, reapVal=0,
+                        rng=random):
+    """Returns a list of random integers This funciton generates a list of random
+    integers from a normal distribution with a mean(meanVal), miminum(minVal),
+    and maximum(maxVal) values.
+    The sum of the list will == the product of mean(meanVal) and number of
+    elements(nVal) specified.
+    Values are drawn from minVal to maxVal - 1 and neighbouring values differ by
+    at least reapVal. The list has the same distribution as drawing values
+    one at a time until a list has the right sum, but every value is drawn
+    once, weighted by the chance that the rest of the list can still reach
+    the total (see blockWeights), so the time it takes does not depend on how
+    rare such lists are.
+    Raises ValueError when no list meets the constraints.
+    """
+    total = nVal * meanVal
+    if maxVal == 0:     # if no max value is specified it will default to total
+                        # thus impossible to be met.
+        maxVal = total
+    values = np.arange(minVal, maxVal)
+    if nVal < 1 or len(values) == 0 or minVal < 0:
+        raise ValueError(f"no list of {nVal} values in [{minVal}, {maxVal}) "
+                         f"sums to {total}")
+    f, step = blockWeights(nVal, total, values, reapVal)
+    remaining = total
+    weights = np.zeros(len(values))
+    fits = (values <= remaining)
+    weights[fits] = f[-1][fits, remaining - values[fits]]
+    if weights.sum() <= 0:
+        raise ValueError(f"no list of {nVal} values in [{minVal}, {maxVal}) with "
+                         f"neighbours at least {reapVal} apart sums to {total}")
+    outputList = []
+    for k in range(nVal - 1, -1, -1):
+        # weights: chance of each next value times the chance to finish after it
+        pick = rng.choices(range(len(values)), weights=weights)[0]
+        outputList.append(int(values[pick]))
+        remaining -= values[pick]
+        if k > 0:
+            fits = (values <= remaining)
+            weights = np.zeros(len(values))
+            weights[fits] = step[pick, fits] * f[k - 1][fits, remaining - values[fits]]
+    return outputList
+
+
+def makeContingentBlockList(input, first=None, rng=random):
+    """Return a list of alternating 0s and 1s
+    start of the sequence will be random, the list will be used to map the
+    contingent condition (0 == shape, 1 == color)
+    first sets the start of the sequence instead (for counterbalancing)
+    """
+    outputList = []     # initiate an empty list
+    if first is None:
+        first = rng.randint(0, 1)   # make first element random
+    outputList.append(first)
+    # since first element is alread set, loop for 1 element less
+    for i in range(len(input) - 1):
+        if outputList[-1] == 0:     # if last element is 0, append 1
+            outputList.append(1)
+        else:
+            outputList[-1] == 1     # if last element is 1, append 0
+            outputList.append(0)
+    return outputList
+
+
+def makeProbabilityConditionList(input, rng=random):
+    """Returns a list alternating values from the probability list
+    in my case, the two values represent high and low probability conditions,
+    probConds = [0.75,0.90]
+    """
+    while True:
+        outputList = []     # initiate empty list
+        for i in range(len(input)):     # iterate the length of input list
+            if (i % 2) == 0:  # determine if element position is even (if divisible by 2)
+                            # 0 is considered even
+                # set prob to a random integer (0 or 1)
+                prob = rng.randint(0, 1)
+                outputList.append(prob)  # append list with new prob value
+            elif (i % 2) == 1:    # if element position is odd
+                # append list with the same prob value as before
+                outputList.append(prob)
+        avgList = sum(outputList) / len(outputList)
+        if avgList > 0.3 and avgList < 0.7:
+            break
+    return outputList
+
+
+# feedback
+# probability that a correct choice is rewarded, per probability condition
+probConds = [0.75, 0.90]
+
+# correct answer (1 == up, 0 == down) by [version, contingent condition,
+# stimulus], stimuli in the order of stimList: blue square, blue circle,
+# green square, green circle; contingent condition 0 == color, 1 == shape
+correctAnswerTable = np.array([[[0, 0, 1, 1],     # version 0, color
+                                [1, 0, 1, 0]],    # version 0, shape
+                               [[1, 1, 0, 0],     # version 1, color
+                                [0, 1, 0, 1]]],   # version 1, shape
+                              dtype=np.int8)
+
+# surprise type of an incorrect feedback by stimulus
+# 0 == InfoTheo surprise (blue circle, green square), 1 == Bayes surprise
+surpriseTypeTable = np.array([1, 0, 0, 1], dtype=np.int8)
+
+
+def makeForcedErrorList(blockTrialNumbs, probabilityConditionList, rng=random):
+    """Returns for every trial of the session whether a correct choice gets
+    incorrect feedback (1) or not (0), drawn all at once.
+    Each trial is 1 with probability 1 - probConds[probability condition of
+    its block].
+    """
+    pCorrect = np.repeat(np.take(probConds, probabilityConditionList),
+                         blockTrialNumbs)
+    draws = np.random.default_rng(rng.getrandbits(32)).random(len(pCorrect))
+    return (draws >= pCorrect).astype(int).tolist()
@@ -0,0 +1,103 @@
+"""
+Fixed-slot trial records and append-only history logs.
+
+The trial loop used to hand each finished trial to the save thread with
+deepcopy(trialDataDict), which also copies the choice and slider histories
+and so gets slower the more the participant moves the slider. A SlotRecord
+keeps the trial fields in __slots__ and snapshot() copies only those slots.
+Histories are appended to a HistoryLog and the record only keeps a
+HistorySpan (log, start, stop) pointing into it. Rows of a log never change
+once written, so a span can be handed to another thread as is and the
+handoff costs the same for every trial.
+"""
+
+import numpy as np
+
+
+class SlotRecord:
+    """Base of the record types made by makeRecordType.
+    Fields are read and written like a dictionary (record['points']) so it
+    can stand in for the trial data dictionary.
+    """
+    __slots__ = ()
+
+    def __init__(self):
+        for key in self.__slots__:
+            setattr(self, key, None)
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def snapshot(self):
+        # this function returns a copy of the slots (histories are shared)
+        outRecord = object.__new__(type(self))
+        for key in self.__slots__:
+            setattr(outRecord, key, getattr(self, key))
+        return outRecord
+
+
+def makeRecordType(name, keys):
+    # this function returns a record class with one slot per key
+    return type(name, (SlotRecord,), {'__slots__': tuple(keys)})
+
+
+class HistoryLog:
+    """Append-only array of history rows for the whole session.
+    Input: python type of each column (used when a span is turned back into
+           a list, e.g. (int, float) for [choice, time])
+           python type of a row (list or tuple)
+           number of rows to preallocate (doubled when full)
+    """
+
+    def __init__(self, columns, rowType=list, capacity=4096):
+        self.columns = columns
+        self.rowType = rowType
+        self.data = np.zeros((capacity, len(columns)))
+        self.n = 0
+
+    def append(self, row):
+        if self.n == len(self.data):
+            # written rows are copied, older arrays stay valid for readers
+            data = np.zeros((2 * len(self.data), len(self.columns)))
+            data[:self.n] = self.data[:self.n]
+            self.data = data
+        self.data[self.n] = [np.nan if value is None else value for value in row]
+        self.n += 1
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def span(self, start):
+        # this function returns the rows appended since start
+        return HistorySpan(self, start, self.n)
+
+
+class HistorySpan:
+    """Rows start:stop of a HistoryLog.
+    str() gives the same text as the list of rows it replaces.
+    """
+    __slots__ = ('log', 'data', 'start', 'stop')
+
+    def __init__(self, log, start, stop):
+        self.log = log
+        self.data = log.data    # rows before stop never change in this array
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def tolist(self):
+        return [self.log.rowType(column(value) for column, value in
+                                 zip(self.log.columns, row))
+                for row in self.data[self.start:self.stop].tolist()]
+
+    def __str__(self):
+        return str(self.tolist())
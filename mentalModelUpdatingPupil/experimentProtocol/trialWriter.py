@@ -0,0 +1,105 @@
+"""
+Buffered, crash-safe writer for the per-trial summary CSV.
+
+Writing a trial used to build a one-row pandas dataframe and reopen the CSV.
+TrialWriter keeps the CSV open with a fixed column order and formats each
+trial with the csv module, the same way pandas wrote it (None as an empty
+field, everything else with str()). The CSV itself is only flushed to disk
+every `syncEvery` trials. Every trial is also appended to a small journal
+next to the CSV that is synced right away, so after a power loss at most the
+trial being written is lost: the next TrialWriter on the same file replays
+the journal into the CSV.
+"""
+
+import csv
+import io
+import os
+
+
+class TrialWriter:
+    """Writes one CSV row per trial.
+    Input: path of the CSV (appended to if it exists, header written if new)
+           list of columns, in order
+           number of trials between syncs of the CSV itself
+           dictionary of values that are the same for every trial
+           (e.g. participant information)
+    """
+
+    def __init__(self, csvPath, columns, syncEvery=10, fixedValues=None):
+        self.csvPath = csvPath
+        self.journalPath = csvPath + '.journal'
+        self.columns = list(columns)
+        self.syncEvery = syncEvery
+        self.fixedValues = {} if fixedValues is None else dict(fixedValues)
+        self.unsynced = 0
+        # one line buffer and csv writer reused for every row
+        self.line = io.StringIO()
+        self.lineWriter = csv.writer(self.line, lineterminator=os.linesep)
+        self.recover()
+        self.csvFile = open(csvPath, 'a', newline='')
+        self.journalFile = open(self.journalPath, 'w', newline='')
+        if self.csvFile.tell() == 0:
+            self.csvFile.write(self.formatRow(self.columns))
+        self.startJournal()
+
+    def formatRow(self, values):
+        # this function returns one CSV formatted line
+        self.line.seek(0)
+        self.line.truncate()
+        self.lineWriter.writerow(['' if value is None else str(value)
+                                  for value in values])
+        return self.line.getvalue()
+
+    def startJournal(self):
+        # sync the CSV, then restart the journal from the synced CSV size
+        self.csvFile.flush()
+        os.fsync(self.csvFile.fileno())
+        self.journalFile.seek(0)
+        self.journalFile.truncate()
+        self.journalFile.write(f"{self.csvFile.tell()}\n")
+        self.journalFile.flush()
+        os.fsync(self.journalFile.fileno())
+        self.unsynced = 0
+
+    def recover(self):
+        """Replays the journal of a run that did not close properly.
+        The CSV is cut back to its size at the last sync and every complete
+        journal line written after that sync is appended again.
+        """
+        if not os.path.exists(self.journalPath):
+            return
+        with open(self.journalPath, newline='') as journalFile:
+            journal = journalFile.read()
+        header, _, rows = journal.partition('\n')
+        if not header.isdigit() or not os.path.exists(self.csvPath):
+            return
+        # drop a line that was cut off in the middle of being written
+        rows = rows[:rows.rfind(os.linesep) + len(os.linesep)] if os.linesep in rows else ''
+        with open(self.csvPath, 'r+', newline='') as csvFile:
+            csvFile.truncate(int(header))
+            csvFile.seek(int(header))
+            csvFile.write(rows)
+            csvFile.flush()
+            os.fsync(csvFile.fileno())
+
+    def write(self, record):
+        """Writes one trial.
+        Input: dictionary (or trialRecord record) with a value for each column
+               that is not in fixedValues, missing ones are left empty
+        """
+        row = self.formatRow([self.fixedValues[column] if column in self.fixedValues
+                              else record.get(column) for column in self.columns])
+        self.journalFile.write(row)
+        self.journalFile.flush()
+        os.fsync(self.journalFile.fileno())
+        self.csvFile.write(row)
+        self.unsynced += 1
+        if self.unsynced >= self.syncEvery:
+            self.startJournal()
+
+    def close(self):
+        # sync everything and remove the journal
+        self.startJournal()
+        self.csvFile.close()
+        self.journalFile.close()
+        os.remove(self.journalPath)